@@ -0,0 +1,62 @@
+import time
+import uuid
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+VERSION_KEY = 'version:{}'
+MODIFIED_KEY = 'modified:{}'
+
+
+def new_version():
+    """Новое, ни разу не выданное значение версии."""
+    return uuid.uuid4().hex
+
+
+def get_version(name):
+    """Текущая версия набора данных name (каталог, корзина и т.п.).
+
+    Версия — непрозрачная строка, а не счётчик: каждый сдвиг записывает
+    новое уникальное значение. Поэтому данные под ключом с версией всегда
+    прочитаны после её записи, даже если кэш не умеет атомарный incr
+    (файловый) и два сдвига пришли одновременно. После очистки кэша версия
+    тоже не совпадёт с уже выданной клиентам.
+    """
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_modified(name):
+    """Время (unix, в секундах) последнего изменения набора данных name."""
+    key = MODIFIED_KEY.format(name)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, int(time.time()), timeout=None)
+        modified = cache.get(key)
+    return modified
+
+
+def _bump_version(name):
+    cache.set(MODIFIED_KEY.format(name), int(time.time()), timeout=None)
+    cache.set(VERSION_KEY.format(name), new_version(), timeout=None)
+
+
+def bump_version(name):
+    """Сдвигает версию набора данных name после его изменения.
+
+    Внутри транзакции сдвиг откладывается до её фиксации: иначе
+    параллельный запрос успел бы закэшировать старые данные под новой
+    версией.
+    """
+    transaction.on_commit(partial(_bump_version, name))
+
+
+def cart_version_name(user_id):
+    """Имя версии списка покупок пользователя."""
+    return f'cart:{user_id}'
@@ -0,0 +1,52 @@
+import io
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework.fields import ImageField
+from PIL import Image
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта: base64-строка или файл из multipart-формы.
+
+    Размер файла и изображения проверяются до полного декодирования:
+    для base64 — по длине строки, затем по заголовку картинки.
+    """
+    SIZE_MESSAGE = 'Размер изображения не должен превышать {} МБ.'
+    DIMENSIONS_MESSAGE = (
+        'Стороны изображения не должны превышать {} пикселей.'
+    )
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(self.SIZE_MESSAGE.format(
+                settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)
+            ))
+
+    def check_dimensions(self, file):
+        """Читает только заголовок изображения и проверяет его стороны."""
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            file.seek(0)
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE:
+            raise ValidationError(self.DIMENSIONS_MESSAGE.format(
+                settings.RECIPE_IMAGE_MAX_SIDE
+            ))
+
+    def get_file_extension(self, filename, decoded_file):
+        self.check_dimensions(io.BytesIO(decoded_file))
+        return super().get_file_extension(filename, decoded_file)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or data in self.EMPTY_VALUES:
+            if data:
+                self.check_size(len(data.split(';base64,')[-1]) * 3 // 4)
+            return super().to_internal_value(data)
+        self.check_size(data.size)
+        self.check_dimensions(data)
+        return ImageField.to_internal_value(self, data)
@@ -5,7 +5,8 @@ from recipes.models import Recipes, Tag
 
 
 class RecipesFilter(FilterSet):
-    """Фильтрация по автору, тэгу, избранному и добавленному в покупки."""
+    """Фильтрация по автору, тэгу, избранному, добавленному в покупки
+    и поиск по тексту рецепта."""
     author = filters.CharFilter(
         field_name='author__id',
     )
@@ -20,6 +21,9 @@ class RecipesFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='cart_filter'
     )
+    search = filters.CharFilter(
+        method='search_filter'
+    )
 
     def favorited_filter(self, queryset, name, value):
         if value:
@@ -31,6 +35,9 @@ class RecipesFilter(FilterSet):
             return queryset.filter(cart__author=self.request.user)
         return queryset
 
+    def search_filter(self, queryset, name, value):
+        return queryset.search(value)
+
     class Meta:
         model = Recipes
         fields = ('tags', 'author', 'is_favorited')
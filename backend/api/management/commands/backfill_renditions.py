@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipes, RenditionJob
+
+
+class Command(BaseCommand):
+    help = 'Queue renditions for recipes whose images were never processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Сколько заданий создавать за один запрос')
+
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.exclude(
+            image=''
+        ).exclude(
+            image__isnull=True
+        ).filter(
+            renditions={}
+        ).exclude(
+            rendition_jobs__status__in=(
+                RenditionJob.PENDING,
+                RenditionJob.PROCESSING
+            )
+        ).values_list('pk', flat=True).iterator()
+        total = 0
+        batch = []
+        for recipe_id in recipes:
+            batch.append(RenditionJob(recipe_id=recipe_id))
+            if len(batch) == options['batch_size']:
+                total += len(RenditionJob.objects.bulk_create(batch))
+                batch = []
+        total += len(RenditionJob.objects.bulk_create(batch))
+        self.stdout.write(self.style.SUCCESS(
+            f'Поставлено в очередь рецептов: {total}'
+        ))
@@ -0,0 +1,88 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.benchmark_api import percentile
+from api.units import UNITS, aggregate_ingredients
+
+
+# Единицы без перевода: складываются только между собой.
+OTHER_UNITS = ('шт.', 'ст. л.', 'по вкусу')
+
+
+def synthetic_rows(count, products, seed):
+    """Строки (название, единица, количество) как у корзины с count
+    ингредиентами: названия повторяются с разным регистром и «ё»/«е»,
+    масса и объём — в разных единицах."""
+    generator = random.Random(seed)
+    units = list(UNITS) + list(OTHER_UNITS)
+    rows = []
+    for _ in range(count):
+        name = f'Продукт {generator.randrange(products)} тёртый'
+        if generator.random() < 0.3:
+            name = name.upper().replace('Ё', 'Е')
+        rows.append((
+            name,
+            generator.choice(units),
+            generator.randint(1, 1000),
+        ))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Measure shopping list aggregation over synthetic ingredient rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', nargs='*', default=[100, 1000, 10000], type=int,
+            help='Размеры корзин в строках ингредиентов')
+        parser.add_argument(
+            '--products', default=1000, type=int,
+            help='Сколько разных продуктов встречается в строках')
+        parser.add_argument(
+            '--iterations', default=20, type=int,
+            help='Сколько раз свести каждую корзину')
+        parser.add_argument(
+            '--seed', default=42, type=int,
+            help='Зерно генератора строк')
+
+    def measure(self, rows, iterations):
+        timings = []
+        for iteration in range(iterations + 1):
+            started = time.perf_counter()
+            items = aggregate_ingredients(rows)
+            if iteration:
+                timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'rows': len(rows),
+            'lines': len(items),
+            'iterations': iterations,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'max_ms': round(max(timings), 2),
+        }
+
+    def handle(self, *args, **options):
+        sizes = options['rows']
+        if (
+            not sizes or min(sizes) < 1
+            or options['iterations'] < 1 or options['products'] < 1
+        ):
+            raise CommandError('Неверный размер корзины, число продуктов '
+                               'или итераций')
+        # Первый прогон каждой корзины не учитывается.
+        results = [
+            self.measure(
+                synthetic_rows(size, options['products'], options['seed']),
+                options['iterations']
+            )
+            for size in sizes
+        ]
+        self.stdout.write(json.dumps({
+            'products': options['products'],
+            'carts': results,
+        }, ensure_ascii=False, indent=2))
@@ -0,0 +1,401 @@
+import base64
+import io
+import json
+import math
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate)
+
+from api.caching import bump_version, cart_version_name
+from api.views import RecipesViewSet
+from recipes.models import Cart, Ingredient, Recipes, Tag
+from users.models import User
+
+
+# (название, анонимный запрос, шаги (метод, адрес)) — шаги одного
+# сценария замеряются вместе как одна итерация.
+# Ленту при разном числе подписок замеряют от имени perf_feed_N:
+# --user perf_feed_10000 --scenario recipes_feed.
+SCENARIOS = (
+    ('recipes_list', False, (('get', '/api/recipes/'),)),
+    ('recipes_list_anonymous', True, (('get', '/api/recipes/'),)),
+    ('recipes_list_filtered', False, (
+        ('get', '/api/recipes/?tags={tag}&is_favorited=1'),
+    )),
+    ('recipes_list_cursor', False, (
+        ('get', '/api/recipes/?pagination=cursor'),
+    )),
+    ('recipes_search', False, (('get', '/api/recipes/?search={term}'),)),
+    ('recipe_detail', False, (('get', '/api/recipes/{recipe}/'),)),
+    ('subscriptions', False, (('get', '/api/users/subscriptions/'),)),
+    ('recipes_feed', False, (('get', '/api/recipes/feed/'),)),
+    ('users_list', False, (('get', '/api/users/'),)),
+    ('ingredients_search', False, (
+        ('get', '/api/ingredients/?name={ingredient}'),
+    )),
+    ('favorite_toggle', False, (
+        ('post', '/api/recipes/{free_recipe}/favorite/'),
+        ('delete', '/api/recipes/{free_recipe}/favorite/'),
+    )),
+    ('cart_toggle', False, (
+        ('post', '/api/recipes/{free_recipe}/shopping_cart/'),
+        ('delete', '/api/recipes/{free_recipe}/shopping_cart/'),
+    )),
+    ('shopping_list', False, (('get', '/api/recipes/shopping_list/'),)),
+    ('download_shopping_cart_txt', False, (
+        ('get', '/api/recipes/download_shopping_cart/?format=txt'),
+    )),
+    ('download_shopping_cart_csv', False, (
+        ('get', '/api/recipes/download_shopping_cart/?format=csv'),
+    )),
+    ('download_shopping_cart_json', False, (
+        ('get', '/api/recipes/download_shopping_cart/?format=json'),
+    )),
+    ('download_shopping_cart_pdf', False, (
+        ('get', '/api/recipes/download_shopping_cart/'),
+    )),
+)
+
+# Форматы выгрузки списка покупок для замера по размерам корзины.
+DOWNLOAD_FORMATS = ('pdf', 'txt', 'csv', 'json')
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ (ru_maxrss: КБ в Linux, байты в macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def noise_jpeg(side):
+    """JPEG из шума: сжимается примерно как фотография."""
+    size = (side, side * 3 // 4)
+    image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main API endpoints and print the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', default=30, type=int,
+            help='Сколько замеров на сценарий')
+        parser.add_argument(
+            '--warmup', default=3, type=int,
+            help='Сколько прогонов сценария не учитывать')
+        parser.add_argument(
+            '--user',
+            help='Пользователь, от имени которого идут запросы '
+                 '(по умолчанию первый из seed_perf_data)')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=[name for name, _, _ in SCENARIOS],
+            help='Запустить только этот сценарий (можно несколько раз)')
+        parser.add_argument(
+            '--cart-sizes', nargs='*', default=[], type=int,
+            help='Замерить выгрузку списка покупок во всех форматах для '
+                 'корзин такого размера, например --cart-sizes 10 100 1000')
+        parser.add_argument(
+            '--uploads', default=0, type=int,
+            help='Сколько раз замерить пиковый RSS загрузки изображения '
+                 'в base64 и multipart (по умолчанию не замеряется)')
+        parser.add_argument(
+            '--upload-side', default=2000, type=int,
+            help='Ширина изображения для замера загрузки, пикселей')
+        parser.add_argument(
+            '--label', default='',
+            help='Метка прогона, например хэш коммита')
+        parser.add_argument(
+            '--output',
+            help='Файл для результата (по умолчанию — вывод команды)')
+
+    def get_user(self, username):
+        users = User.objects.order_by('pk')
+        if username:
+            users = users.filter(username=username)
+        else:
+            users = users.filter(username__startswith='perf_user_')
+        user = users.first()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден, сначала запустите seed_perf_data'
+            )
+        return user
+
+    def get_context(self, user):
+        """Значения для подстановки в адреса сценариев."""
+        recipe = Recipes.objects.order_by('-pub_date').first()
+        free_recipe = Recipes.objects.exclude(
+            favorite__author=user
+        ).exclude(
+            cart__author=user
+        ).order_by('pk').first()
+        if recipe is None or free_recipe is None:
+            raise CommandError('В базе нет подходящих рецептов')
+        tag = recipe.tags.first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        return {
+            'recipe': recipe.pk,
+            'free_recipe': free_recipe.pk,
+            'tag': tag.slug if tag else '',
+            'term': recipe.name.split()[0],
+            'ingredient': ingredient.name[:2] if ingredient else '',
+        }
+
+    def run_step(self, client, method, path):
+        """Время, процессорное время воркера, число запросов к базе
+        и код ответа одного шага."""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            response = getattr(client, method)(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            cpu = time.process_time() - cpu_started
+            elapsed = time.perf_counter() - started
+        return elapsed, cpu, len(queries), response.status_code
+
+    def summarize(self, timings, cpu_timings, query_counts, statuses):
+        return {
+            'iterations': len(timings),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'cpu_p50_ms': round(percentile(cpu_timings, 50), 2),
+            'queries': percentile(query_counts, 50),
+            'max_queries': max(query_counts),
+            'statuses': sorted(statuses),
+        }
+
+    def run_scenario(self, client, steps, iterations, warmup, before=None):
+        """Прогоняет шаги сценария; before вызывается перед каждой
+        итерацией вне замера."""
+        timings = []
+        cpu_timings = []
+        query_counts = []
+        statuses = set()
+        for iteration in range(warmup + iterations):
+            if before is not None:
+                before()
+            total = cpu_total = 0.0
+            queries = 0
+            for method, path in steps:
+                elapsed, cpu, count, status = self.run_step(
+                    client, method, path
+                )
+                total += elapsed
+                cpu_total += cpu
+                queries += count
+                statuses.add(status)
+            if iteration >= warmup:
+                timings.append(total * 1000)
+                cpu_timings.append(cpu_total * 1000)
+                query_counts.append(queries)
+        return self.summarize(timings, cpu_timings, query_counts, statuses)
+
+    def run_cart_downloads(self, client, user, sizes, iterations, warmup):
+        """Выгрузка списка покупок во всех форматах для корзин из sizes
+        рецептов. PDF каждый раз собирается заново, без кэша.
+
+        Корзина пользователя на время замера подменяется и затем
+        восстанавливается.
+        """
+        original = list(
+            Cart.objects.filter(author=user).values_list('recipe', flat=True)
+        )
+        recipe_ids = list(
+            Recipes.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if max(sizes) > len(recipe_ids):
+            raise CommandError(f'В базе только {len(recipe_ids)} рецептов')
+        version = cart_version_name(user.pk)
+        results = {}
+        try:
+            for size in sizes:
+                Cart.objects.remove_many(user)
+                Cart.objects.add_many(user, recipe_ids[:size])
+                results[size] = {
+                    download_format: self.run_scenario(
+                        client,
+                        [('get', '/api/recipes/download_shopping_cart/'
+                                 f'?format={download_format}')],
+                        iterations,
+                        warmup,
+                        before=(
+                            (lambda: bump_version(version))
+                            if download_format == 'pdf' else None
+                        )
+                    )
+                    for download_format in DOWNLOAD_FORMATS
+                }
+        finally:
+            Cart.objects.remove_many(user)
+            Cart.objects.add_many(user, original)
+        return results
+
+    def upload_request(self, user, upload, image, number):
+        """Запрос на создание рецепта, собранный до начала замера."""
+        tag = Tag.objects.order_by('pk').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        data = {
+            'name': f'benchmark upload {upload} {number} {os.getpid()}',
+            'text': 'Рецепт для замера загрузки изображения.',
+            'cooking_time': 10,
+            'tags': [tag.pk],
+        }
+        ingredients = [{'id': ingredient.pk, 'amount': 1}]
+        if upload == 'base64':
+            encoded = base64.b64encode(image).decode()
+            data['image'] = f'data:image/jpeg;base64,{encoded}'
+            data['ingredients'] = ingredients
+        else:
+            data['image'] = SimpleUploadedFile(
+                'benchmark.jpg', image, 'image/jpeg'
+            )
+            data['ingredients'] = json.dumps(ingredients)
+        request = APIRequestFactory().post(
+            '/api/recipes/',
+            data,
+            format='json' if upload == 'base64' else 'multipart'
+        )
+        force_authenticate(request, user=user)
+        return request
+
+    def upload_in_child(self, user, upload, image, number, pipe):
+        """Одна загрузка в дочернем процессе: пик RSS считается от
+        состояния после сборки запроса."""
+        request = self.upload_request(user, upload, image, number)
+        before = peak_rss_mb()
+        started = time.perf_counter()
+        response = RecipesViewSet.as_view({'post': 'create'})(request)
+        elapsed = time.perf_counter() - started
+        growth = peak_rss_mb() - before
+        if response.status_code == 201:
+            recipe = Recipes.objects.get(pk=response.data['id'])
+            recipe.image.delete(save=False)
+            recipe.delete()
+        connection.close()
+        pipe.send((response.status_code, growth, elapsed * 1000))
+
+    def run_uploads(self, user, iterations, side):
+        """Пиковый рост RSS на одну загрузку для base64 и multipart.
+
+        Каждая загрузка идёт в отдельном процессе (fork), иначе пик
+        первой загрузки скрыл бы остальные.
+        """
+        if not (Tag.objects.exists() and Ingredient.objects.exists()):
+            raise CommandError('Для замера загрузки нужны тэги и ингредиенты')
+        context = multiprocessing.get_context('fork')
+        image = noise_jpeg(side)
+        results = {'image_bytes': len(image)}
+        for upload in ('base64', 'multipart'):
+            growths, timings, statuses = [], [], set()
+            for number in range(iterations):
+                # Дочерний процесс не должен использовать соединения
+                # родителя.
+                connections.close_all()
+                receiver, sender = context.Pipe(duplex=False)
+                child = context.Process(
+                    target=self.upload_in_child,
+                    args=(user, upload, image, number, sender)
+                )
+                child.start()
+                status, growth, elapsed = receiver.recv()
+                child.join()
+                statuses.add(status)
+                growths.append(growth)
+                timings.append(elapsed)
+            results[upload] = {
+                'iterations': iterations,
+                'peak_rss_growth_mb_p50': round(percentile(growths, 50), 1),
+                'peak_rss_growth_mb_max': round(max(growths), 1),
+                'p50_ms': round(percentile(timings, 50), 2),
+                'statuses': sorted(statuses),
+            }
+        return results
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError('Неверное число итераций')
+        user = self.get_user(options['user'])
+        context = self.get_context(user)
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        anonymous = APIClient()
+
+        selected = options['scenarios']
+        results = {}
+        for name, is_anonymous, steps in SCENARIOS:
+            if selected and name not in selected:
+                continue
+            results[name] = self.run_scenario(
+                anonymous if is_anonymous else client,
+                [(method, path.format(**context)) for method, path in steps],
+                options['iterations'],
+                options['warmup']
+            )
+            if options['verbosity'] > 1:
+                self.stderr.write(
+                    f'{name}: p50 {results[name]["p50_ms"]} мс, '
+                    f'p95 {results[name]["p95_ms"]} мс, '
+                    f'запросов {results[name]["queries"]}'
+                )
+
+        carts = None
+        if options['cart_sizes']:
+            carts = self.run_cart_downloads(
+                client,
+                user,
+                options['cart_sizes'],
+                options['iterations'],
+                options['warmup']
+            )
+
+        uploads = None
+        if options['uploads'] > 0:
+            uploads = self.run_uploads(
+                user, options['uploads'], options['upload_side']
+            )
+
+        report = json.dumps({
+            'label': options['label'],
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'user': user.username,
+            'users': User.objects.count(),
+            'recipes': Recipes.objects.count(),
+            'scenarios': results,
+            'carts': carts,
+            'uploads': uploads,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.management.commands.benchmark_api import percentile
+from api.search import ingredient_index
+from recipes.models import Ingredient
+
+
+def sql_search(prefix):
+    """Прежний путь: SearchFilter с search_fields = ('^name',)."""
+    return list(Ingredient.objects.filter(
+        name__istartswith=prefix
+    ).values('id', 'name', 'measurement_unit'))
+
+
+class Command(BaseCommand):
+    help = 'Compare ingredient autocomplete: prefix index against SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', default=20, type=int,
+            help='Сколько раз прогнать все префиксы')
+        parser.add_argument(
+            '--prefixes', default=50, type=int,
+            help='Сколько префиксов взять из каталога')
+
+    def get_prefixes(self, count):
+        """Начала названий длиной 1–3 символа, как при наборе."""
+        names = list(Ingredient.objects.order_by('pk').values_list(
+            'name', flat=True
+        ))
+        if not names:
+            raise CommandError('Каталог ингредиентов пуст')
+        step = max(len(names) // count, 1)
+        return [
+            name[:index % 3 + 1]
+            for index, name in enumerate(names[::step][:count])
+        ]
+
+    def measure(self, search, prefixes, iterations):
+        timings = []
+        for iteration in range(iterations + 1):
+            for prefix in prefixes:
+                started = time.perf_counter()
+                search(prefix)
+                if iteration:
+                    timings.append((time.perf_counter() - started) * 1e6)
+        return {
+            'lookups': len(timings),
+            'p50_us': round(percentile(timings, 50), 1),
+            'p95_us': round(percentile(timings, 95), 1),
+            'mean_us': round(statistics.fmean(timings), 1),
+        }
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['prefixes'] < 1:
+            raise CommandError('Неверное число итераций или префиксов')
+        prefixes = self.get_prefixes(options['prefixes'])
+        # Первый прогон каждого пути не учитывается: в нём строится индекс
+        # и прогревается соединение.
+        results = {
+            'index': self.measure(
+                ingredient_index.search, prefixes, options['iterations']
+            ),
+            'sql': self.measure(sql_search, prefixes, options['iterations']),
+        }
+        self.stdout.write(json.dumps({
+            'database': connection.vendor,
+            'ingredients': Ingredient.objects.count(),
+            'prefixes': len(prefixes),
+            'paths': results,
+        }, ensure_ascii=False, indent=2))
@@ -1,15 +1,65 @@
+import csv
 import json
 import os
+import re
+import time
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import transaction
 
+from api.caching import bump_version
 from recipes.models import Ingredient, Tag
 
 
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов.')
+    position = 1
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON.')
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_ndjson(file):
+    """Читает файл с одним JSON-объектом на строку."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv(file, fields):
+    """Читает CSV с колонками fields; строка заголовка необязательна."""
+    reader = csv.reader(file)
+    for row in reader:
+        if row == list(fields):
+            continue
+        if row:
+            yield dict(zip(fields, row))
+
+
 class Command(BaseCommand):
-    help = 'Import ingredients to DB from json'
+    help = 'Import ingredients and tags to DB from json, ndjson or csv'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -22,33 +72,123 @@ class Command(BaseCommand):
             default='tags.json',
             nargs='?',
             type=str)
+        parser.add_argument(
+            '--format',
+            choices=('json', 'ndjson', 'csv'),
+            help='Формат файлов (по умолчанию — по расширению)')
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Сколько строк записывать за одну транзакцию')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет добавлено и изменено')
+
+    def read(self, filename, fields, file_format):
+        path = os.path.join(settings.MEDIA_ROOT + '/data/', filename)
+        file_format = file_format or os.path.splitext(path)[1].lstrip('.')
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            if file_format == 'csv':
+                yield from iter_csv(file, fields)
+            elif file_format in ('ndjson', 'jsonl'):
+                yield from iter_ndjson(file)
+            else:
+                yield from iter_json_array(file)
+
+    def load(self, model, rows, key, fields):
+        """Пакетная загрузка: новые строки добавляются, у существующих
+        (по полю key) обновляются поля fields."""
+        total = created = updated = 0
+        started = time.perf_counter()
+        rows = iter(rows)
+        number = 0
+        while True:
+            batch = {
+                row[key]: row for row in islice(rows, self.batch_size)
+            }
+            if not batch:
+                break
+            number += 1
+            batch_started = time.perf_counter()
+            with transaction.atomic():
+                existing = {
+                    getattr(obj, key): obj
+                    for obj in model.objects.filter(
+                        **{f'{key}__in': batch}
+                    ).only('pk', key, *fields)
+                }
+                new = []
+                changed = []
+                for value, row in batch.items():
+                    obj = existing.get(value)
+                    if obj is None:
+                        new.append(model(**{
+                            key: value,
+                            **{field: row[field] for field in fields}
+                        }))
+                    elif any(
+                        getattr(obj, field) != row[field] for field in fields
+                    ):
+                        for field in fields:
+                            setattr(obj, field, row[field])
+                        changed.append(obj)
+                        if self.verbosity > 1:
+                            self.stdout.write(f'  изменится: {value}')
+                if not self.dry_run:
+                    model.objects.bulk_create(new, ignore_conflicts=True)
+                    model.objects.bulk_update(changed, fields)
+            elapsed = time.perf_counter() - batch_started
+            total += len(batch)
+            created += len(new)
+            updated += len(changed)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}, пакет {number}: '
+                f'{len(batch)} строк, новых {len(new)}, '
+                f'изменённых {len(changed)}, {elapsed:.3f} с, '
+                f'{len(batch) / elapsed:.0f} строк/с'
+            )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{model._meta.verbose_name_plural}: {total} строк, '
+            f'новых {created}, изменённых {updated}, '
+            f'без изменений {total - created - updated}, '
+            f'{elapsed:.2f} с, {total / max(elapsed, 1e-9):.0f} строк/с'
+            + (' (пробный запуск, база не изменена)' if self.dry_run else '')
+        ))
 
     def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
         try:
-            with open(os.path.join(
-                settings.MEDIA_ROOT + '/data/', options['tags']), 'r',
-                    encoding='utf-8') as f:
-                data_tags = json.load(f)
-                for tag in data_tags:
-                    try:
-                        Tag.objects.create(name=tag['name'],
-                                           color=tag['color'],
-                                           slug=tag['slug'])
-                    except IntegrityError:
-                        print(f'В базе уже есть: {tag["name"]} ')
-
-            with open(os.path.join(
-                settings.MEDIA_ROOT + '/data/', options['ingredients']), 'r',
-                    encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(name=ingredient['name'],
-                                                  measurement_unit=ingredient[
-                                                      'measurement_unit'])
-                    except IntegrityError:
-                        print(f'В базе уже есть: {ingredient["name"]} '
-                              f'({ingredient["measurement_unit"]})')
-
+            self.load(
+                Tag,
+                self.read(
+                    options['tags'],
+                    ('name', 'color', 'slug'),
+                    options['format']
+                ),
+                'slug',
+                ('name', 'color')
+            )
+            self.load(
+                Ingredient,
+                self.read(
+                    options['ingredients'],
+                    ('name', 'measurement_unit'),
+                    options['format']
+                ),
+                'name',
+                ('measurement_unit',)
+            )
         except FileNotFoundError:
             raise CommandError('Файл отсутствует в директории media/data')
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Некорректная строка в файле: {error}')
+        if not self.dry_run:
+            bump_version('tags')
+            bump_version('ingredients')
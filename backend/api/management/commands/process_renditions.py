@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.renditions import process
+
+
+class Command(BaseCommand):
+    help = 'Process queued recipe image renditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            default=os.cpu_count(),
+            type=int,
+            help='Размер пула процессов')
+        parser.add_argument(
+            '--batch-size',
+            default=20,
+            type=int,
+            help='Сколько заданий забирать из очереди за раз')
+        parser.add_argument(
+            '--interval',
+            default=5,
+            type=float,
+            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process(options['batch_size'], options['workers'])
+            if processed:
+                self.stdout.write(f'Обработано заданий: {processed}')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild fan-out feeds of users with many subscriptions'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        threshold = settings.FEED_FANOUT_THRESHOLD
+        user_ids = list(User.objects.filter(
+            following_count__gte=threshold
+        ).order_by('pk').values_list('pk', flat=True))
+        for user_id in user_ids:
+            with transaction.atomic():
+                FeedEntry.objects.rebuild(user_id)
+        # Лента тех, у кого подписок стало меньше порога, не читается.
+        removed, _ = FeedEntry.objects.exclude(user__in=user_ids).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент пересобрано: {len(user_ids)} '
+            f'(порог {threshold} подписок), '
+            f'записей в ленте: {FeedEntry.objects.count()}, '
+            f'удалено лишних: {removed}, '
+            f'{time.perf_counter() - started:.2f} с'
+        ))
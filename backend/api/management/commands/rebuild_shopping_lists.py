@@ -0,0 +1,87 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.caching import bump_version, cart_version_name
+from recipes.models import ShoppingListItem
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild shopping list totals from carts and report differences'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=500,
+            type=int,
+            help='Сколько пользователей пересчитывать за одну транзакцию')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только сравнить, не перезаписывая итоги')
+
+    def rebuild(self, user_ids):
+        with transaction.atomic():
+            expected = ShoppingListItem.objects.expected(user_ids)
+            items = ShoppingListItem.objects.filter(user__in=user_ids)
+            actual = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in items.values_list(
+                    'user', 'ingredient', 'amount'
+                )
+            }
+            differences = sorted(
+                key for key in expected.keys() | actual.keys()
+                if expected.get(key) != actual.get(key)
+            )
+            if self.verbosity > 1:
+                for user_id, ingredient_id in differences:
+                    self.stdout.write(
+                        f'  пользователь {user_id}, '
+                        f'ингредиент {ingredient_id}: '
+                        f'{actual.get((user_id, ingredient_id))} -> '
+                        f'{expected.get((user_id, ingredient_id))}'
+                    )
+            if differences and not self.dry_run:
+                items.delete()
+                ShoppingListItem.objects.bulk_create(
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for (user_id, ingredient_id), amount in expected.items()
+                )
+                # Иначе кэшированные PDF отдавали бы старый список.
+                for user_id in {key[0] for key in differences}:
+                    bump_version(cart_version_name(user_id))
+        return len(differences), len({key[0] for key in differences})
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        started = time.perf_counter()
+        total = rows = users = 0
+        last_id = 0
+        while True:
+            user_ids = list(User.objects.filter(
+                pk__gt=last_id
+            ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            total += len(user_ids)
+            batch_rows, batch_users = self.rebuild(user_ids)
+            rows += batch_rows
+            users += batch_users
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено пользователей: {total}, с расхождениями: {users}, '
+            f'расхождений в позициях: {rows}, '
+            f'{time.perf_counter() - started:.2f} с'
+            + (' (пробный запуск, база не изменена)' if self.dry_run else '')
+        ))
@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import capfirst
+
+from api.caching import bump_version
+from recipes.models import Recipes
+from users.models import Subscription, User
+
+
+# Модель, выборка с посчитанными значениями actual_<счётчик>, счётчики.
+TARGETS = (
+    (
+        Recipes,
+        lambda queryset: queryset.with_actual_counters(),
+        ('favorites_count', 'in_carts_count'),
+    ),
+    (
+        User,
+        Subscription.objects.with_actual_counters,
+        ('followers_count', 'following_count'),
+    ),
+)
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized counters of recipes and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Сколько строк пересчитывать за одну транзакцию')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать строки с расхождениями')
+
+    def recount(self, model, with_actual, counters, ids):
+        changed = []
+        with transaction.atomic():
+            rows = with_actual(
+                model.objects.filter(pk__in=ids).select_for_update()
+            ).only('pk', *counters)
+            for row in rows:
+                drift = {
+                    field: getattr(row, f'actual_{field}')
+                    for field in counters
+                    if getattr(row, field) != getattr(row, f'actual_{field}')
+                }
+                if not drift:
+                    continue
+                if self.verbosity > 1:
+                    self.stdout.write(
+                        f'  {model._meta.verbose_name} {row.pk}: {drift}'
+                    )
+                for field, value in drift.items():
+                    setattr(row, field, value)
+                changed.append(row)
+            if not self.dry_run:
+                model.objects.bulk_update(changed, counters)
+        return len(changed)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        for model, with_actual, counters in TARGETS:
+            started = time.perf_counter()
+            total = fixed = 0
+            last_id = 0
+            while True:
+                ids = list(model.objects.filter(
+                    pk__gt=last_id
+                ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                total += len(ids)
+                fixed += self.recount(model, with_actual, counters, ids)
+            if fixed and not self.dry_run and model is Recipes:
+                bump_version('recipes')
+            name = capfirst(model._meta.verbose_name_plural)
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: проверено {total}, с расхождениями {fixed}, '
+                f'{time.perf_counter() - started:.2f} с'
+                + (' (пробный запуск, база не изменена)'
+                   if self.dry_run else '')
+            ))
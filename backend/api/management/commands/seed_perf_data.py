@@ -0,0 +1,232 @@
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.caching import bump_version
+from recipes.models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipes,
+    Tag)
+from users.models import Subscription, User
+
+
+PREFIX = 'perf'
+PASSWORD = 'perf-password'
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Generate deterministic synthetic data for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', default=1000, type=int,
+            help='Сколько пользователей создать')
+        parser.add_argument(
+            '--recipes', default=10000, type=int,
+            help='Сколько рецептов создать')
+        parser.add_argument(
+            '--ingredients-per-recipe', default=8, type=int,
+            help='Ингредиентов в рецепте')
+        parser.add_argument(
+            '--tags-per-recipe', default=2, type=int,
+            help='Тэгов у рецепта')
+        parser.add_argument(
+            '--favorites-per-user', default=20, type=int,
+            help='Рецептов в избранном у пользователя')
+        parser.add_argument(
+            '--carts-per-user', default=5, type=int,
+            help='Рецептов в списке покупок у пользователя')
+        parser.add_argument(
+            '--subscriptions-per-user', default=10, type=int,
+            help='Подписок у пользователя')
+        parser.add_argument(
+            '--feed-readers', nargs='*', default=[10, 1000, 10000], type=int,
+            help='Для каждого N создать пользователя perf_feed_N, '
+                 'подписанного на N авторов (не больше --users)')
+        parser.add_argument(
+            '--seed', default=42, type=int,
+            help='Зерно генератора: одинаковое зерно — одинаковые данные')
+        parser.add_argument(
+            '--batch-size', default=2000, type=int,
+            help='Сколько строк вставлять за один запрос')
+
+    def log(self, message):
+        self.stdout.write(
+            f'{message}: {time.perf_counter() - self.started:.1f} с'
+        )
+
+    def insert(self, model, rows):
+        """Вставляет строки пачками, не собирая их все в памяти."""
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def catalogue(self):
+        """Тэги и ингредиенты из базы, а если их нет — синтетические."""
+        if not Tag.objects.exists():
+            self.insert(Tag, (
+                Tag(name=f'{PREFIX} tag {i}', color=f'#{i:06x}',
+                    slug=f'{PREFIX}-tag-{i}')
+                for i in range(8)
+            ))
+        if not Ingredient.objects.exists():
+            units = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.')
+            self.insert(Ingredient, (
+                Ingredient(name=f'{PREFIX} ingredient {i}',
+                           measurement_unit=units[i % len(units)])
+                for i in range(2000)
+            ))
+        return (
+            list(Tag.objects.order_by('pk').values_list('pk', flat=True)),
+            list(Ingredient.objects.order_by('pk').values_list(
+                'pk', flat=True
+            )),
+        )
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        self.insert(User, (
+            User(
+                username=f'{PREFIX}_user_{i}',
+                email=f'{PREFIX}_user_{i}@example.com',
+                first_name='Perf',
+                last_name=f'User {i}',
+                password=password,
+            ) for i in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=f'{PREFIX}_user_'
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes(self, count, user_ids):
+        self.insert(Recipes, (
+            Recipes(
+                name=f'{PREFIX} recipe {i}',
+                text=f'Описание синтетического рецепта номер {i}.',
+                cooking_time=self.random.randint(1, 240),
+                author_id=self.random.choice(user_ids),
+            ) for i in range(count)
+        ))
+        return list(Recipes.objects.filter(
+            name__startswith=f'{PREFIX} recipe '
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_links(self, recipe_ids, tag_ids, ingredient_ids, options):
+        tags_count = min(options['tags_per_recipe'], len(tag_ids))
+        ingredients_count = min(
+            options['ingredients_per_recipe'], len(ingredient_ids)
+        )
+        tag_link_model = Recipes.tags.through
+        self.insert(tag_link_model, (
+            tag_link_model(recipes_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(tag_ids, tags_count)
+        ))
+        self.insert(IngredientInRecipe, (
+            IngredientInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids, ingredients_count
+            )
+        ))
+
+    def create_pairs(self, model, fields, owners, targets, per_owner):
+        """Связи «пользователь — per_owner случайных целей» без связей
+        пользователя с самим собой."""
+        owner_field, target_field = fields
+        per_owner = min(per_owner, len(targets))
+        self.insert(model, (
+            model(**{owner_field: owner_id, target_field: target_id})
+            for owner_id in owners
+            for target_id in self.random.sample(targets, per_owner)
+            if not (model is Subscription and target_id == owner_id)
+        ))
+
+    def create_feed_readers(self, counts, user_ids):
+        """Читатели ленты с заданным числом подписок."""
+        password = make_password(PASSWORD)
+        self.insert(User, (
+            User(
+                username=f'{PREFIX}_feed_{count}',
+                email=f'{PREFIX}_feed_{count}@example.com',
+                first_name='Perf',
+                last_name=f'Feed {count}',
+                password=password,
+            ) for count in counts
+        ))
+        for count in counts:
+            reader = User.objects.get(username=f'{PREFIX}_feed_{count}')
+            self.insert(Subscription, (
+                Subscription(user_id=reader.pk, following_id=author_id)
+                for author_id in self.random.sample(
+                    user_ids, min(count, len(user_ids))
+                )
+            ))
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт')
+        self.random = random.Random(options['seed'])
+        self.started = time.perf_counter()
+
+        with transaction.atomic():
+            tag_ids, ingredient_ids = self.catalogue()
+            user_ids = self.create_users(options['users'])
+            self.log(f'Пользователей: {len(user_ids)}')
+            recipe_ids = self.create_recipes(options['recipes'], user_ids)
+            self.log(f'Рецептов: {len(recipe_ids)}')
+            self.create_links(recipe_ids, tag_ids, ingredient_ids, options)
+            self.log('Тэги и ингредиенты рецептов')
+            self.create_pairs(
+                Favorite, ('author_id', 'recipe_id'),
+                user_ids, recipe_ids, options['favorites_per_user']
+            )
+            self.create_pairs(
+                Cart, ('author_id', 'recipe_id'),
+                user_ids, recipe_ids, options['carts_per_user']
+            )
+            self.create_pairs(
+                Subscription, ('user_id', 'following_id'),
+                user_ids, user_ids, options['subscriptions_per_user']
+            )
+            self.create_feed_readers(options['feed_readers'], user_ids)
+            self.log('Избранное, списки покупок и подписки')
+            Recipes.objects.filter(
+                name__startswith=f'{PREFIX} recipe '
+            ).update_search_vector()
+
+        # Массовые вставки идут мимо сигналов: счётчики и итоги списков
+        # покупок пересчитываются штатными командами.
+        call_command('recount', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_feeds', stdout=self.stdout)
+        for name in ('recipes', 'tags', 'ingredients'):
+            bump_version(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - self.started:.1f} с. '
+            f'Пароль пользователей {PREFIX}_user_N и {PREFIX}_feed_N: '
+            f'{PASSWORD}'
+        ))
@@ -0,0 +1,175 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счётчики одного запроса: запросы к базе, время базы и
+    сериализации."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper для учёта запросов к базе."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+    def server_timing(self, total):
+        return (
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.db_queries} queries", '
+            f'serialize;dur={self.serialize_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с метками view и method."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, labels, value):
+        self.counts[labels][bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        for (view, method), counts in sorted(self.counts.items()):
+            labels = f'view="{view}",method="{method}"'
+            total = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                total += count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {total}'
+            yield f'{self.name}_sum{{{labels}}} {self.sums[view, method]}'
+            yield f'{self.name}_count{{{labels}}} {total}'
+
+
+class Registry:
+    """Гистограммы по маршрутам в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_time = Histogram(
+            'api_request_duration_seconds',
+            'Request processing time.',
+            TIME_BUCKETS
+        )
+        self.db_time = Histogram(
+            'api_db_duration_seconds',
+            'Time spent in database queries per request.',
+            TIME_BUCKETS
+        )
+        self.db_queries = Histogram(
+            'api_db_queries',
+            'Database queries per request.',
+            QUERY_BUCKETS
+        )
+        self.serialize_time = Histogram(
+            'api_serialize_duration_seconds',
+            'Time spent in serializers per request.',
+            TIME_BUCKETS
+        )
+
+    def observe(self, labels, metrics, total):
+        with self.lock:
+            self.request_time.observe(labels, total)
+            self.db_time.observe(labels, metrics.db_time)
+            self.db_queries.observe(labels, metrics.db_queries)
+            self.serialize_time.observe(labels, metrics.serialize_time)
+
+    def expose(self):
+        with self.lock:
+            lines = [
+                line
+                for histogram in (
+                    self.request_time,
+                    self.db_time,
+                    self.db_queries,
+                    self.serialize_time,
+                )
+                for line in histogram.expose()
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """Считает запросы к базе и время обработки каждого запроса.
+
+    Итоги отдаются в заголовке Server-Timing и копятся в гистограммах
+    по имени маршрута (см. /api/_metrics).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - metrics.started
+        response['Server-Timing'] = metrics.server_timing(total)
+        match = request.resolver_match
+        registry.observe(
+            (match.view_name if match else 'unmatched', request.method),
+            metrics,
+            total
+        )
+        return response
+
+
+class TimedSerializerMixin:
+    """Добавляет время сериализации к метрикам текущего запроса.
+
+    Вложенные сериализаторы не учитываются повторно.
+    """
+
+    def to_representation(self, instance):
+        metrics = current.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serialize_time += time.perf_counter() - started
+            metrics.serializing = False
@@ -1,4 +1,13 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
+from rest_framework.response import Response
+
+from api.caching import get_modified, get_version
 
 
 class ViewOnlyViewSet(
@@ -8,3 +17,100 @@ class ViewOnlyViewSet(
 ):
     """Вьюсет для обработки только GET запросов."""
     pagination_class = None
+
+
+class ConditionalCatalogueMixin:
+    """Условные GET-запросы к справочникам (ETag / Last-Modified / 304).
+
+    ETag строится из версии справочника catalogue, адреса запроса и формата
+    ответа, поэтому на совпавший If-None-Match ответ 304 отдаётся без
+    выборки из базы и без сериализации.
+    """
+    catalogue = None
+
+    def get_etag(self, request):
+        version = get_version(self.catalogue)
+        digest = hashlib.md5(
+            f'{version}:{request.get_full_path()}:'
+            f'{request.accepted_renderer.format}'.encode()
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        last_modified = get_modified(self.catalogue)
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'no-cache'
+            patch_vary_headers(response, ('Accept',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class AnonymousResponseCacheMixin:
+    """Общий кэш ответов list/retrieve для анонимных пользователей.
+
+    Ключ строится из версий наборов данных response_cache_versions, хоста,
+    пути, отсортированных параметров запроса и формата ответа. Любое
+    изменение данных сдвигает версию, поэтому устаревший ответ не отдаётся.
+    В заголовке X-Cache указывается HIT или MISS.
+    """
+    response_cache_versions = ()
+
+    def get_response_cache_key(self, request):
+        versions = ':'.join(
+            str(get_version(name)) for name in self.response_cache_versions
+        )
+        query = '&'.join(
+            f'{name}={value}'
+            for name, values in sorted(request.query_params.lists())
+            for value in sorted(values)
+        )
+        digest = hashlib.md5(
+            f'{request.get_host()}|{request.path}|{query}|'
+            f'{request.accepted_renderer.format}'.encode()
+        ).hexdigest()
+        return f'response:{versions}:{digest}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        cache = caches[settings.RESPONSE_CACHE]
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,117 @@
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """Постраничный вывод по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Курсор хранит дату и id последнего рецепта страницы, следующая страница
+    выбирается условием «строго старше курсора» по индексу pub_date.
+    Поля ключа задаются ordering, например ('pub_date', 'recipe_id')
+    для ленты подписок.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    ordering = ('pub_date', 'id')
+
+    def __init__(self, page_size, mode_query_param=None, mode=None,
+                 ordering=None):
+        self.page_size = page_size
+        self.mode_query_param = mode_query_param
+        self.mode = mode
+        if ordering is not None:
+            self.ordering = ordering
+
+    def encode_cursor(self, obj):
+        date_field, id_field = self.ordering
+        position = (
+            f'{getattr(obj, date_field).isoformat()}|{getattr(obj, id_field)}'
+        )
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = base64.urlsafe_b64decode(encoded.encode()).decode()
+            pub_date, pk = position.split('|')
+            pub_date, pk = parse_datetime(pub_date), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        date_field, id_field = self.ordering
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__lt': pub_date})
+                | Q(**{date_field: pub_date, f'{id_field}__lt': pk})
+            )
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.mode_query_param:
+            url = replace_query_param(url, self.mode_query_param, self.mode)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class RecipesPagination(PageNumberPagination):
+    """Постраничный вывод рецептов.
+
+    По умолчанию — номера страниц. С параметром ``pagination=cursor``
+    (или ``cursor=...``) включается вывод по ключу без подсчёта записей.
+    """
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+
+    def is_cursor_mode(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if not self.is_cursor_mode(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination(
+            self.get_page_size(request),
+            self.mode_query_param,
+            self.cursor_mode
+        )
+        return self.keyset.paginate_queryset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return self.keyset.get_paginated_response(data)
@@ -12,6 +12,13 @@ class IsAdminOrReadOnlyPermission(permissions.BasePermission):
         )
 
 
+class IsAdminPermission(permissions.BasePermission):
+    """Права только для администраторов"""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_admin
+
+
 class IsAuthorOrAdminOrModeratorPermission(permissions.BasePermission):
     """Права, разрешающие редактировать пользователям и администрации"""
 
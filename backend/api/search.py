@@ -0,0 +1,67 @@
+import threading
+from bisect import bisect_left
+from operator import itemgetter
+
+from api.caching import get_version
+from recipes.models import Ingredient
+
+
+def normalize(text):
+    """Приводит строку к виду для поиска: без регистра и с «е» вместо «ё»."""
+    return text.strip().casefold().replace('ё', 'е')
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов по началу названия в памяти процесса.
+
+    Хранит отсортированный список нормализованных названий и ищет по нему
+    бинарным поиском. Строится лениво при первом запросе и перестраивается,
+    когда меняется версия каталога 'ingredients'.
+    """
+    version_name = 'ingredients'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        # (ключи, записи) публикуются одним присваиванием, чтобы поиск
+        # без блокировки не смешал ключи нового индекса с записями старого.
+        self.index = ([], [])
+
+    def build(self, version):
+        # Только по ключу: «Мёд» и «мед» дают одинаковые ключи.
+        rows = sorted(
+            (
+                (
+                    normalize(name),
+                    {'id': pk, 'name': name, 'measurement_unit': unit}
+                )
+                for pk, name, unit in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                )
+            ),
+            key=itemgetter(0)
+        )
+        self.index = (
+            [key for key, entry in rows],
+            [entry for key, entry in rows],
+        )
+        self.version = version
+
+    def actualize(self):
+        version = get_version(self.version_name)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.build(version)
+
+    def search(self, prefix):
+        """Ингредиенты, название которых начинается с prefix."""
+        self.actualize()
+        keys, entries = self.index
+        key = normalize(prefix)
+        start = bisect_left(keys, key)
+        end = bisect_left(keys, key + '\U0010ffff', start)
+        return entries[start:end]
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -1,18 +1,47 @@
+import json
+
+from django.core.files.storage import default_storage
 from django.db import transaction
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.relations import SlugRelatedField
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.fields import RecipeImageField
+from api.metrics import TimedSerializerMixin
+from recipes import renditions
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientInRecipe,
     Recipes,
+    ShoppingListItem,
     Tag)
 from users.models import User
 
 
+class RenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения по размерам и форматам.
+
+    Пока копии не готовы, отдаётся пустой словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'renditions')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for size, formats in (value or {}).items():
+            urls[size] = {}
+            for image_format, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[size][image_format] = url
+        return urls
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор избранных рецептов."""
 
@@ -37,7 +66,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ]
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор пользователя."""
 
     class Meta:
@@ -45,7 +74,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('email', 'id', 'username', 'first_name', 'last_name')
 
 
-class TagsSerializer(serializers.ModelSerializer):
+class TagsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор тэгов."""
 
     class Meta:
@@ -53,7 +82,7 @@ class TagsSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class IngredientsSerializer(serializers.ModelSerializer):
+class IngredientsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор ингридиентов."""
 
     class Meta:
@@ -79,7 +108,7 @@ class IngredientWriteSerializer(serializers.ModelSerializer):
         return data
 
 
-class RecipesSerializer(serializers.ModelSerializer):
+class RecipesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор рецептов."""
 
     author = UserSerializer(
@@ -92,24 +121,10 @@ class RecipesSerializer(serializers.ModelSerializer):
         read_only=True
     )
     tags = TagsSerializer(many=True)
-    is_favorited = serializers.SerializerMethodField(
-        read_only=True,
-        method_name='get_is_favorited'
-    )
-    is_in_shopping_cart = serializers.SerializerMethodField(
-        read_only=True,
-        method_name='get_is_in_shopping_cart'
-    )
-
-    def get_is_favorited(self, recipe):
-        user = self.context['request'].user
-        return (not user.is_anonymous
-                and recipe.favorite.filter(author=user).exists())
-
-    def get_is_in_shopping_cart(self, recipe):
-        user = self.context['request'].user
-        return (not user.is_anonymous
-                and recipe.cart.filter(author=user).exists())
+    images = RenditionsField()
+    # Значения приходят аннотациями из Recipes.objects.with_user_flags().
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         fields = (
@@ -121,26 +136,34 @@ class RecipesSerializer(serializers.ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'images',
             'text',
-            'cooking_time'
+            'cooking_time',
+            'favorites_count'
         )
         model = Recipes
 
 
-class RecipeSmallSerializer(serializers.ModelSerializer):
+class RecipeSmallSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для вывода списка рецептов в подписках."""
 
+    images = RenditionsField()
+
     class Meta:
         fields = (
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
         model = Recipes
 
 
-class RecipesSerializerCreate(serializers.ModelSerializer):
+class RecipesSerializerCreate(
+    TimedSerializerMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор создания рецептов."""
 
     author = UserSerializer(
@@ -152,7 +175,7 @@ class RecipesSerializerCreate(serializers.ModelSerializer):
         many=True,
         read_only=True
     )
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         fields = (
@@ -189,50 +212,111 @@ class RecipesSerializerCreate(serializers.ModelSerializer):
             )
         return text[0].upper() + text[1:]
 
-    def validate(self, data):
-        ingredients_data = self.initial_data.get('ingredients')
-
-        if not ingredients_data:
+    def parse_amounts(self, ingredients_data):
+        """Проверяет список ингредиентов из запроса и возвращает
+        словарь {id ингредиента: количество}."""
+        if not isinstance(ingredients_data, list):
             raise serializers.ValidationError(
-                'Добавьте хотя бы один ингредиент.'
+                'Ингредиенты передаются списком.'
             )
-
-        ingredients_list = []
+        amounts = {}
         for ingredient in ingredients_data:
-            ingredient_id = ingredient['id']
+            if (
+                not isinstance(ingredient, dict)
+                or 'id' not in ingredient
+                or 'amount' not in ingredient
+            ):
+                raise serializers.ValidationError(
+                    'Для каждого ингредиента укажите id и amount.'
+                )
+            raw_id = ingredient['id']
             try:
-                int(ingredient['amount'])
-            except ValueError:
+                ingredient_id = int(raw_id)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(
+                    f'Не найден ингредиент с id={raw_id}!'
+                )
+            try:
+                amount = int(ingredient['amount'])
+            except (TypeError, ValueError):
                 raise serializers.ValidationError(
                     'Количество ингридиента можно указывать только числом!'
                 )
-            if int(ingredient['amount']) <= 0:
+            if amount <= 0:
                 raise serializers.ValidationError(
                     'Укажите вес/количество ингридиентов.'
                 )
+            if ingredient_id in amounts:
+                raise serializers.ValidationError(
+                    'Игридиенты не должны повторяться!'
+                )
+            amounts[ingredient_id] = amount
+        return amounts
 
-            if not Ingredient.objects.filter(id=ingredient_id).exists():
+    def validate(self, data):
+        ingredients_data = self.initial_data.get('ingredients')
+        if isinstance(ingredients_data, str):
+            # В multipart-форме список ингредиентов передаётся JSON-строкой.
+            try:
+                ingredients_data = json.loads(ingredients_data)
+            except ValueError:
                 raise serializers.ValidationError(
-                    f'Не найден ингредиент с id={ingredient_id}!'
+                    'Ингредиенты передаются списком в формате JSON.'
                 )
-            if ingredient_id in ingredients_list:
+
+        if not ingredients_data:
+            raise serializers.ValidationError(
+                'Добавьте хотя бы один ингредиент.'
+            )
+
+        amounts = self.parse_amounts(ingredients_data)
+        existing = set(Ingredient.objects.filter(
+            id__in=amounts
+        ).values_list('id', flat=True))
+        for ingredient_id in amounts:
+            if ingredient_id not in existing:
                 raise serializers.ValidationError(
-                    'Игридиенты не должны повторяться!'
+                    f'Не найден ингредиент с id={ingredient_id}!'
                 )
-            ingredients_list.append(ingredient_id)
+        data['ingredient_amounts'] = amounts
         return data
 
-    def create_ingridients(self, ingredients_data, recipe):
-        for ingredient in ingredients_data:
+    def create_ingridients(self, amounts, recipe):
+        IngredientInRecipe.objects.bulk_create(
             IngredientInRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient['id'],
-                amount=ingredient.get('amount')
-            ).save()
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+        )
+
+    def update_ingridients(self, amounts, recipe):
+        """Приводит ингредиенты рецепта к amounts: удаляет лишние,
+        обновляет изменившиеся количества и добавляет новые. Разница
+        переносится в списки покупок тех, у кого рецепт в корзине."""
+        removed = []
+        changed = []
+        deltas = {}
+        for row in IngredientInRecipe.objects.filter(recipe=recipe):
+            amount = amounts.pop(row.ingredient_id, None)
+            if amount is None:
+                removed.append(row.id)
+                deltas[row.ingredient_id] = -row.amount
+            elif amount != row.amount:
+                deltas[row.ingredient_id] = amount - row.amount
+                row.amount = amount
+                changed.append(row)
+        deltas.update(amounts)
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+        IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        self.create_ingridients(amounts, recipe)
+        ShoppingListItem.objects.change_recipe(recipe.id, deltas)
 
     @transaction.atomic
     def create(self, validated_data):
-        ingredients_data = self.initial_data.get('ingredients')
+        amounts = validated_data.pop('ingredient_amounts')
         tags = validated_data.pop('tags')
 
         recipe = Recipes.objects.create(
@@ -240,31 +324,58 @@ class RecipesSerializerCreate(serializers.ModelSerializer):
             **validated_data
         )
 
-        self.create_ingridients(ingredients_data, recipe)
+        self.create_ingridients(amounts, recipe)
 
         recipe.tags.set(tags)
+        renditions.enqueue(recipe)
         return recipe
 
+    def to_representation(self, recipe):
+        """Ответ после создания/изменения отдаётся в формате списка рецептов
+        и собирается той же выборкой, что и list/retrieve."""
+        request = self.context['request']
+        recipe = Recipes.objects.with_user_flags(
+            request.user
+        ).with_related().get(pk=recipe.pk)
+        return RecipesSerializer(recipe, context=self.context).data
+
     @transaction.atomic
     def update(self, recipe, validated_data):
-        recipe.ingredients.clear()
-        recipe.tags.clear()
-        ingredients_data = self.initial_data.get('ingredients')
+        amounts = validated_data.pop('ingredient_amounts')
         tags = validated_data.pop('tags')
         recipe.tags.set(tags)
-        IngredientInRecipe.objects.filter(recipe=recipe).all().delete()
-        self.create_ingridients(ingredients_data, recipe)
-        return super().update(recipe, validated_data)
+        self.update_ingridients(amounts, recipe)
+        if 'image' in validated_data:
+            renditions.discard(recipe.renditions)
+            validated_data['renditions'] = {}
+        recipe = super().update(recipe, validated_data)
+        if 'image' in validated_data:
+            renditions.enqueue(recipe)
+        return recipe
 
 
-class ActionsSerializer(serializers.ModelSerializer):
+class ActionsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для управления рецептами."""
 
+    images = RenditionsField()
+
     class Meta:
         fields = (
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
         model = Recipes
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массовых операций с избранным и
+    списком покупок."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=200
+    )
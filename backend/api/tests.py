@@ -0,0 +1,540 @@
+import base64
+import io
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.caching import get_version
+from api.pagination import RecipesPagination
+from api.utils import pdf_generate
+from recipes.models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipes,
+    ShoppingListItem,
+    Tag)
+from users.models import User
+
+
+LOCMEM_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'tests-{alias}',
+    }
+    for alias in ('default', 'responses')
+}
+
+
+def image_data_uri():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipesAPITestCase(TestCase):
+    """Общие данные: автор, читатель, тэги и ингредиенты; изображения
+    сохраняются во временный каталог."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тэг {i}', color=f'#00000{i}', slug=f'tag-{i}'
+            ) for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            ) for i in range(40)
+        ]
+
+    def setUp(self):
+        for alias in LOCMEM_CACHES:
+            caches[alias].clear()
+        self.author_client = self.client_for(self.author)
+        self.user_client = self.client_for(self.user)
+        self.anonymous_client = APIClient()
+
+    def client_for(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def payload(self, name, count, offset=0, amount=1):
+        return {
+            'name': name,
+            'text': 'Описание рецепта для тестов.',
+            'cooking_time': 10,
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount + number}
+                for number, ingredient in enumerate(
+                    self.ingredients[offset:offset + count]
+                )
+            ],
+            'image': image_data_uri(),
+        }
+
+    def create_recipes(self, count, ingredients_per_recipe=3):
+        recipes = []
+        for number in range(count):
+            recipe = Recipes.objects.create(
+                author=self.author,
+                name=f'Рецепт {number}',
+                text='Описание рецепта для тестов.',
+                cooking_time=10,
+            )
+            recipe.tags.set(self.tags[:2])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in self.ingredients[:ingredients_per_recipe]
+            )
+            recipes.append(recipe)
+        return recipes
+
+
+class RecipesListQueriesTest(RecipesAPITestCase):
+    """Флаги is_favorited и is_in_shopping_cart не добавляют запросов
+    на каждый рецепт страницы."""
+
+    def test_authenticated_page_query_budget(self):
+        recipes = self.create_recipes(6)
+        for recipe in recipes[::2]:
+            self.user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+            self.user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        # Токен, COUNT, рецепты с флагами, тэги, ингредиенты.
+        with self.assertNumQueries(5):
+            response = self.user_client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        flags = {
+            recipe['id']: (
+                recipe['is_favorited'], recipe['is_in_shopping_cart']
+            )
+            for recipe in response.data['results']
+        }
+        for index, recipe in enumerate(recipes):
+            self.assertEqual(flags[recipe.id], (index % 2 == 0,) * 2)
+
+    def test_anonymous_page_query_budget(self):
+        self.create_recipes(6)
+        with self.assertNumQueries(4):
+            response = self.anonymous_client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['is_in_shopping_cart']
+            for recipe in response.data['results']
+        ))
+
+
+class RecipesEagerLoadingTest(RecipesAPITestCase):
+    """Автор, тэги и ингредиенты загружаются фиксированным числом
+    запросов при любом размере страницы."""
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        self.create_recipes(200, ingredients_per_recipe=5)
+        for page_size in (6, 50, 200):
+            with self.subTest(page_size=page_size), mock.patch.object(
+                RecipesPagination, 'page_size', page_size
+            ):
+                with self.assertNumQueries(5):
+                    response = self.user_client.get('/api/recipes/')
+                self.assertEqual(len(response.data['results']), page_size)
+                for recipe in response.data['results']:
+                    self.assertEqual(len(recipe['tags']), 2)
+                    self.assertEqual(len(recipe['ingredients']), 5)
+
+    def test_cursor_list_query_count(self):
+        self.create_recipes(50)
+        with mock.patch.object(RecipesPagination, 'page_size', 50):
+            # Без COUNT: токен, рецепты, тэги, ингредиенты.
+            with self.assertNumQueries(4):
+                response = self.user_client.get(
+                    '/api/recipes/?pagination=cursor'
+                )
+        self.assertEqual(len(response.data['results']), 50)
+
+    def test_retrieve_query_count(self):
+        recipe, = self.create_recipes(1, ingredients_per_recipe=20)
+        with self.assertNumQueries(4):
+            response = self.user_client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(len(response.data['ingredients']), 20)
+        self.assertEqual(response.data['author']['id'], self.author.id)
+
+
+class RecipesWriteQueriesTest(RecipesAPITestCase):
+    """Создание и изменение рецепта не зависят по числу запросов от числа
+    ингредиентов."""
+
+    def assert_shopping_list_consistent(self):
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'amount'
+            )
+        }
+        self.assertEqual(
+            actual, ShoppingListItem.objects.expected([self.user.id])
+        )
+
+    def count_queries(self, request, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = request(*args, format='json', **kwargs)
+        self.assertLess(response.status_code, 300, response.data)
+        return len(queries), response
+
+    def test_create_query_count(self):
+        counts = set()
+        for count in (2, 30):
+            queries, response = self.count_queries(
+                self.author_client.post,
+                '/api/recipes/',
+                self.payload(f'Рецепт на {count}', count)
+            )
+            self.assertEqual(len(response.data['ingredients']), count)
+            counts.add(queries)
+        self.assertEqual(len(counts), 1, counts)
+
+    def update_query_counts(self, in_cart):
+        """Число запросов PATCH для рецептов из 2 и 15 ингредиентов при
+        каждом виде изменений: {вид: {число запросов}}."""
+        changes = {
+            'amounts': lambda count: (count, 0, 7),
+            'replace': lambda count: (count, 20, 1),
+            'mixed': lambda count: (count, count // 2, 3),
+        }
+        counts = {}
+        for kind, change in changes.items():
+            for count in (2, 15):
+                recipe_id = self.author_client.post(
+                    '/api/recipes/',
+                    self.payload(f'Рецепт {kind} {count}', count),
+                    format='json'
+                ).data['id']
+                if in_cart:
+                    self.user_client.post(
+                        f'/api/recipes/{recipe_id}/shopping_cart/'
+                    )
+                name = f'Рецепт {kind} {count}'
+                size, offset, amount = change(count)
+                queries, response = self.count_queries(
+                    self.author_client.patch,
+                    f'/api/recipes/{recipe_id}/',
+                    self.payload(name, size, offset, amount)
+                )
+                self.assertEqual(len(response.data['ingredients']), size)
+                counts.setdefault(kind, set()).add(queries)
+        return counts
+
+    def test_update_query_count(self):
+        for kind, counts in self.update_query_counts(in_cart=False).items():
+            self.assertEqual(len(counts), 1, f'{kind}: {counts}')
+
+    def test_update_query_count_with_recipe_in_cart(self):
+        for kind, counts in self.update_query_counts(in_cart=True).items():
+            self.assertEqual(len(counts), 1, f'{kind}: {counts}')
+        self.assert_shopping_list_consistent()
+
+    def test_malformed_ingredients(self):
+        ingredient_id = self.ingredients[0].id
+        for ingredients in (
+            [{'id': ingredient_id}],
+            [{'amount': 1}],
+            [5],
+            [None],
+            [{'id': [1], 'amount': 1}],
+            {'id': ingredient_id, 'amount': 1},
+            f'[{{"id": {ingredient_id}}}]',
+        ):
+            payload = self.payload('Рецепт с ошибкой', 1)
+            payload['ingredients'] = ingredients
+            response = self.author_client.post(
+                '/api/recipes/', payload, format='json'
+            )
+            self.assertEqual(response.status_code, 400, ingredients)
+        self.assertFalse(Recipes.objects.exists())
+
+
+class ShoppingCartPdfCacheTest(RecipesAPITestCase):
+    """PDF списка покупок собирается заново, только когда меняется
+    корзина пользователя или рецепт из неё."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.in_cart, self.other = self.create_recipes(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_client.post(
+                f'/api/recipes/{self.in_cart.id}/shopping_cart/'
+            )
+
+    def download(self):
+        """Скачивает PDF и возвращает, собирался ли он заново."""
+        with mock.patch(
+            'api.views.pdf_generate', wraps=pdf_generate
+        ) as generate:
+            response = self.user_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return generate.called
+
+    def edit(self, recipe):
+        payload = self.payload(recipe.name, 2, offset=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.author_client.patch(
+                f'/api/recipes/{recipe.id}/', payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_other_recipe_edit_keeps_pdf(self):
+        self.assertTrue(self.download())
+        self.edit(self.other)
+        self.assertFalse(self.download())
+
+    def test_recipe_in_cart_edit_rebuilds_pdf(self):
+        self.assertTrue(self.download())
+        self.edit(self.in_cart)
+        self.assertTrue(self.download())
+        self.assertFalse(self.download())
+
+
+class AnonymousResponseCacheTest(RecipesAPITestCase):
+    """Кэш анонимных ответов не отдаёт данные, устаревшие после правки."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe, = self.create_recipes(1)
+        self.list_url = '/api/recipes/'
+        self.detail_url = f'/api/recipes/{self.recipe.id}/'
+
+    def get(self, url):
+        response = self.anonymous_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def warm_up(self):
+        for url in (self.list_url, self.detail_url):
+            self.get(url)
+            self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+    def assert_fresh(self, check):
+        """После правки оба адреса собираются заново и видят изменения."""
+        for url in (self.list_url, self.detail_url):
+            response = self.get(url)
+            self.assertEqual(response['X-Cache'], 'MISS', url)
+            data = response.data
+            if url == self.list_url:
+                data, = data['results']
+            check(data)
+
+    def test_recipe_edit_through_api(self):
+        self.warm_up()
+        payload = self.payload('Новое название', 2, amount=50)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.author_client.patch(
+                self.detail_url, payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assert_fresh(lambda data: (
+            self.assertEqual(data['name'], 'Новое название'),
+            self.assertEqual(
+                [item['amount'] for item in data['ingredients']], [50, 51]
+            ),
+        ))
+
+    def test_ingredient_amount_change(self):
+        self.warm_up()
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientInRecipe.objects.filter(
+                recipe=self.recipe
+            ).first().delete()
+        self.assert_fresh(
+            lambda data: self.assertEqual(len(data['ingredients']), 2)
+        )
+
+    def test_recipe_tags_change(self):
+        self.warm_up()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.set(self.tags[2:])
+        self.assert_fresh(lambda data: self.assertEqual(
+            [tag['slug'] for tag in data['tags']], ['tag-2']
+        ))
+
+    def test_tag_rename(self):
+        self.warm_up()
+        tag = self.tags[0]
+        tag.name = 'Переименованный'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assert_fresh(lambda data: self.assertIn(
+            'Переименованный', [tag['name'] for tag in data['tags']]
+        ))
+
+    def test_recipe_delete(self):
+        self.warm_up()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author_client.delete(self.detail_url)
+        self.assertEqual(self.get(self.list_url).data['results'], [])
+        response = self.anonymous_client.get(self.detail_url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_uncommitted_edit_does_not_bump_version(self):
+        """До фиксации транзакции версия не сдвигается, иначе параллельный
+        запрос закэшировал бы старые данные под новой версией."""
+        self.warm_up()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipes.objects.get(pk=self.recipe.pk).save()
+            self.assertEqual(self.get(self.list_url)['X-Cache'], 'HIT')
+        self.assertTrue(callbacks)
+
+    def test_bumps_never_repeat_version(self):
+        """Каждый сдвиг даёт новую версию, а не прежнюю + 1: ответ,
+        закэшированный между двумя близкими фиксациями, под итоговой
+        версией не отдаётся."""
+        versions = {get_version('recipes')}
+        for _ in range(2):
+            self.warm_up()
+            with self.captureOnCommitCallbacks(execute=True):
+                Recipes.objects.get(pk=self.recipe.pk).save()
+            versions.add(get_version('recipes'))
+            self.assertEqual(self.get(self.list_url)['X-Cache'], 'MISS')
+        self.assertEqual(len(versions), 3)
+
+
+@skipIf(
+    connection.vendor == 'sqlite',
+    'Тестовая база SQLite в памяти не допускает одновременной записи.'
+)
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecipeTogglesConcurrencyTest(TransactionTestCase):
+    """Одновременные повторные нажатия «в избранное» и «в покупки»
+    получают 201/204 и 400, но не 500."""
+
+    threads = 8
+
+    def setUp(self):
+        for alias in LOCMEM_CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        self.recipe = Recipes.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Описание рецепта для тестов.',
+            cooking_time=10,
+        )
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        IngredientInRecipe.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=5
+        )
+        self.token = Token.objects.create(user=self.user).key
+
+    def run_in_parallel(self, method, url, data=None):
+        """Отправляет запрос из нескольких потоков одновременно и
+        возвращает ответы."""
+        barrier = threading.Barrier(self.threads)
+
+        def send(_):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+            try:
+                barrier.wait()
+                return getattr(client, method)(url, data, format='json')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return list(pool.map(send, range(self.threads)))
+
+    def statuses(self, responses):
+        return sorted(response.status_code for response in responses)
+
+    def check_toggle(self, model, action, counter_field):
+        url = f'/api/recipes/{self.recipe.id}/{action}/'
+        rejected = [400] * (self.threads - 1)
+
+        responses = self.run_in_parallel('post', url)
+        self.assertEqual(self.statuses(responses), [201, *rejected])
+        self.assertEqual(model.objects.filter(author=self.user).count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter_field), 1)
+
+        responses = self.run_in_parallel('delete', url)
+        self.assertEqual(self.statuses(responses), [204, *rejected])
+        self.assertFalse(model.objects.filter(author=self.user).exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter_field), 0)
+
+    def test_favorite(self):
+        self.check_toggle(Favorite, 'favorite', 'favorites_count')
+
+    def test_shopping_cart(self):
+        self.check_toggle(Cart, 'shopping_cart', 'in_carts_count')
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.user).exists()
+        )
+
+    def test_bulk_shopping_cart(self):
+        """Каждый рецепт засчитывается добавленным ровно одному из
+        одновременных массовых запросов."""
+        responses = self.run_in_parallel(
+            'post', '/api/recipes/shopping_cart/',
+            {'recipes': [self.recipe.id]}
+        )
+        self.assertEqual(self.statuses(responses), [200] * self.threads)
+        outcomes = sorted(
+            item['status']
+            for response in responses
+            for item in response.data['recipes']
+        )
+        self.assertEqual(outcomes, ['added', *['exists'] * (self.threads - 1)])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(
+            list(ShoppingListItem.objects.filter(
+                user=self.user
+            ).values_list('amount', flat=True)),
+            [5]
+        )
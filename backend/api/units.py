@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+from api.search import normalize
+
+
+# Единица -> (величина, множитель к базовой единице величины).
+UNITS = {
+    'мг': ('mass', Decimal('0.001')),
+    'г': ('mass', Decimal(1)),
+    'кг': ('mass', Decimal(1000)),
+    'мл': ('volume', Decimal(1)),
+    'л': ('volume', Decimal(1000)),
+}
+
+# Единицы вывода от крупной к мелкой: берётся первая, в которой
+# количество не меньше единицы.
+OUTPUT_UNITS = {
+    'mass': (
+        ('кг', Decimal(1000)),
+        ('г', Decimal(1)),
+        ('мг', Decimal('0.001')),
+    ),
+    'volume': (
+        ('л', Decimal(1000)),
+        ('мл', Decimal(1)),
+    ),
+}
+
+
+def to_output_unit(dimension, total):
+    """Переводит количество в базовой единице в читаемую единицу."""
+    for unit, factor in OUTPUT_UNITS[dimension]:
+        if total >= factor:
+            break
+    return unit, total / factor
+
+
+def to_number(amount):
+    """Целое, если количество целое, иначе число с точностью до тысячных."""
+    amount = Decimal(amount).quantize(Decimal('0.001'))
+    if amount == amount.to_integral_value():
+        return int(amount)
+    return float(amount)
+
+
+def format_amount(amount):
+    """Количество для печати: 1,5 вместо 1.5."""
+    return str(amount).replace('.', ',')
+
+
+def aggregate_ingredients(rows):
+    """Сводит строки (название, единица, количество) в список покупок.
+
+    За один проход приводит массу и объём к граммам и миллилитрам и
+    складывает строки одного продукта (название сравнивается без регистра
+    и различия «е»/«ё»). Прочие единицы («шт.», «ст. л.») складываются
+    только между собой. Результат отсортирован по названию, количество
+    выведено в наиболее читаемой единице.
+    """
+    totals = {}
+    for name, unit, amount in rows:
+        dimension, factor = UNITS.get(unit, (None, None))
+        key = (normalize(name), dimension or unit)
+        if key in totals:
+            totals[key][2] += amount * factor if factor else amount
+        else:
+            totals[key] = [
+                name,
+                unit,
+                Decimal(amount) * factor if factor else Decimal(amount),
+                dimension,
+            ]
+
+    items = []
+    for key in sorted(totals):
+        name, unit, total, dimension = totals[key]
+        if dimension:
+            unit, total = to_output_unit(dimension, total)
+        items.append({
+            'name': name,
+            'measurement_unit': unit,
+            'amount': to_number(total),
+        })
+    return items
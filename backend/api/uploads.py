@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Загружаемый файл слишком большой.'
+    default_code = 'upload_too_large'
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемые файлы частями во временный файл на диске
+    и обрывает загрузку, как только она превысила лимит."""
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary,  # noqa: N803
+        encoding=None
+    ):
+        if content_length > settings.FILE_UPLOAD_MAX_REQUEST_SIZE:
+            raise UploadTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
@@ -1,7 +1,11 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientsViewSet, RecipesViewSet, TagsViewSet
+from api.views import (
+    IngredientsViewSet,
+    MetricsView,
+    RecipesViewSet,
+    TagsViewSet)
 
 
 app_name = 'api'
@@ -13,6 +17,7 @@ router.register('tags', TagsViewSet)
 router.register('ingredients', IngredientsViewSet)
 
 urlpatterns = [
+    path('_metrics', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('', include('users.urls')),
 ]
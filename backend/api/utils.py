@@ -1,3 +1,7 @@
+import csv
+import json
+from functools import lru_cache
+
 import reportlab
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
@@ -8,11 +12,13 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
 
+from api.units import format_amount
 from foodgram.settings import MEDIA_ROOT, SITE_NAME
 
 
-def pdf_generate(text, response):
-    """Функция генерации PDF-файла налету."""
+@lru_cache(maxsize=None)
+def get_styles():
+    """Регистрирует шрифт и собирает стили PDF один раз на процесс."""
     reportlab.rl_config.TTFSearchPath.append(str(MEDIA_ROOT) + '/fonts')
     pdfmetrics.registerFont(TTFont('Open Sans', 'opensans.ttf'))
     styles = getSampleStyleSheet()
@@ -39,6 +45,12 @@ def pdf_generate(text, response):
         textColor=colors.silver,
         alignment=TA_LEFT)
     )
+    return styles
+
+
+def pdf_generate(text, response):
+    """Функция генерации PDF-файла налету."""
+    styles = get_styles()
 
     pdf = SimpleDocTemplate(
         response,
@@ -60,3 +72,48 @@ def pdf_generate(text, response):
     pdf.build(pdf_generate)
 
     return response
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(items):
+    """Построчная выгрузка списка покупок в текст."""
+    for item in items:
+        yield (
+            f'{item["name"]} ({item["measurement_unit"]}) — '
+            f'{format_amount(item["amount"])}\n'
+        )
+
+
+def shopping_cart_csv(items):
+    """Построчная выгрузка списка покупок в CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for item in items:
+        yield writer.writerow((
+            item['name'],
+            item['measurement_unit'],
+            item['amount'],
+        ))
+
+
+def shopping_cart_json(items):
+    """Выгрузка списка покупок JSON-массивом по одному элементу."""
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+SHOPPING_CART_STREAMS = {
+    'txt': shopping_cart_txt,
+    'csv': shopping_cart_csv,
+    'json': shopping_cart_json,
+}
@@ -1,62 +1,100 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.caching import cart_version_name, get_version
 from api.filter import RecipesFilter
-from api.mixins import ViewOnlyViewSet
-from api.utils import pdf_generate
-from api.permissions import IsAuthorOrAdminOrModeratorPermission
+from api.metrics import registry
+from api.mixins import (
+    AnonymousResponseCacheMixin,
+    ConditionalCatalogueMixin,
+    ViewOnlyViewSet)
+from api.pagination import KeysetPagination, RecipesPagination
+from api.utils import SHOPPING_CART_STREAMS, pdf_generate
+from api.permissions import (
+    IsAdminPermission,
+    IsAuthorOrAdminOrModeratorPermission)
+from api.renderers import SHOPPING_CART_RENDERERS
+from api.search import ingredient_index
+from api.units import aggregate_ingredients, format_amount
 from api.serializers import (
     ActionsSerializer,
     IngredientsSerializer,
+    RecipeIdsSerializer,
     RecipesSerializer,
     RecipesSerializerCreate,
     TagsSerializer)
 from recipes.models import (
     Cart,
     Favorite,
+    FeedEntry,
     Ingredient,
-    IngredientInRecipe,
     Recipes,
+    ShoppingListItem,
     Tag)
+from users.models import Subscription
 
 
 class IngredientFilter(SearchFilter):
     search_param = 'name'
 
 
-class TagsViewSet(ViewOnlyViewSet):
+class TagsViewSet(ConditionalCatalogueMixin, ViewOnlyViewSet):
     """Управление тэгами."""
 
+    catalogue = 'tags'
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
 
 
-class IngredientsViewSet(ViewOnlyViewSet):
+class IngredientsViewSet(ConditionalCatalogueMixin, ViewOnlyViewSet):
     """Управление ингридиентами."""
 
+    catalogue = 'ingredients'
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientsSerializer
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientFilter.search_param)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            lambda request: Response(ingredient_index.search(name)),
+            request
+        )
+
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """Управление рецептами."""
 
+    response_cache_versions = ('recipes', 'tags', 'ingredients')
     queryset = Recipes.objects.all()
-    pagination_class = PageNumberPagination
+    pagination_class = RecipesPagination
     permission_classes = (IsAuthorOrAdminOrModeratorPermission,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipesFilter
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    def get_queryset(self):
+        queryset = Recipes.objects.with_user_flags(self.request.user)
+        if self.action in ('list', 'retrieve', 'feed'):
+            return queryset.with_related()
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create' or self.action == 'partial_update':
@@ -64,46 +102,89 @@ class RecipesViewSet(viewsets.ModelViewSet):
         return RecipesSerializer
 
     @action(
-        detail=True,
-        methods=('POST', 'DELETE'),
-        url_path='shopping_cart',
-        permission_classes=[permissions.IsAuthenticatedOrReadOnly],
+        detail=False,
+        methods=('GET',),
+        permission_classes=[permissions.IsAuthenticated],
     )
-    def shopping_cart(self, request, pk=None):
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сверху, с выводом по курсору.
+
+        У кого подписок не меньше FEED_FANOUT_THRESHOLD, страница читается
+        из готовой ленты FeedEntry, у остальных собирается по подпискам.
+        """
         user = request.user
-        recipe = get_object_or_404(Recipes, id=pk)
+        recipes = self.get_queryset()
+        page_size = self.paginator.get_page_size(request)
+        if FeedEntry.objects.uses_fanout(user):
+            paginator = KeysetPagination(
+                page_size,
+                ordering=('pub_date', 'recipe_id')
+            )
+            entries = paginator.paginate_queryset(
+                FeedEntry.objects.filter(user=user).only(
+                    'recipe_id', 'pub_date'
+                ),
+                request
+            )
+            found = recipes.in_bulk([entry.recipe_id for entry in entries])
+            page = [
+                found[entry.recipe_id] for entry in entries
+                if entry.recipe_id in found
+            ]
+        else:
+            paginator = KeysetPagination(page_size)
+            page = paginator.paginate_queryset(
+                recipes.filter(author__in=Subscription.objects.filter(
+                    user=user
+                ).values('following')),
+                request
+            )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-        cart = Cart.objects.filter(
-            author=user,
-            recipe=recipe
-        )
+    def toggle_recipe(self, request, pk, model, errors):
+        """Добавляет рецепт в избранное или список покупок (POST) либо
+        убирает его оттуда (DELETE).
 
+        Решение принимается по числу вставленных или удалённых строк,
+        поэтому повторные и одновременные запросы получают 400, а не 500.
+        """
+        user = request.user
         if request.method == 'POST':
-
-            if cart.exists():
-                error = {
-                    'errors':
-                        'Нельзя повторно добавить рецепт в список покупок.'
-                }
-                return Response(error, status=status.HTTP_400_BAD_REQUEST)
-
-            Cart(
-                author=user,
-                recipe=recipe
-            ).save()
+            recipe = get_object_or_404(
+                Recipes.objects.only(
+                    'id', 'name', 'image', 'renditions', 'cooking_time'
+                ),
+                id=pk
+            )
+            if not model.objects.add(user, recipe):
+                return Response(
+                    {'errors': errors['exists']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             serializer = ActionsSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if not cart.exists():
-            error = {
-                'errors':
-                    'Этот рецепт отсутствует в списке ваших покупок.'
-            }
-            return Response(error, status=status.HTTP_400_BAD_REQUEST)
-
-        cart.delete()
+        if not model.objects.remove(user, pk):
+            get_object_or_404(Recipes, id=pk)
+            return Response(
+                {'errors': errors['missing']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=True,
+        methods=('POST', 'DELETE'),
+        url_path='shopping_cart',
+        permission_classes=[permissions.IsAuthenticatedOrReadOnly],
+    )
+    def shopping_cart(self, request, pk=None):
+        return self.toggle_recipe(request, pk, Cart, {
+            'exists': 'Нельзя повторно добавить рецепт в список покупок.',
+            'missing': 'Этот рецепт отсутствует в списке ваших покупок.',
+        })
+
     @action(
         detail=True,
         methods=('POST', 'DELETE'),
@@ -111,59 +192,140 @@ class RecipesViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticatedOrReadOnly],
     )
     def favorite(self, request, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipes, id=pk)
+        return self.toggle_recipe(request, pk, Favorite, {
+            'exists': 'Нельзя повторно добавить рецепт в избранное.',
+            'missing': 'Этот рецепт отсутствует в вашем избранном.',
+        })
+
+    def bulk_recipes(self, request, model):
+        """Массовое добавление (POST) и удаление (DELETE) рецептов.
 
-        favorite = Favorite.objects.filter(
-            author=user,
-            recipe=recipe
+        В теле передаётся {"recipes": [id, ...]}; DELETE без списка
+        очищает всё. В ответе — результат для каждого id.
+        """
+        serializer = RecipeIdsSerializer(
+            data=request.data,
+            partial=request.method == 'DELETE'
         )
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data.get('recipes')
+        if recipe_ids is not None:
+            recipe_ids = list(dict.fromkeys(recipe_ids))
 
         if request.method == 'POST':
+            outcomes = model.objects.add_many(request.user, recipe_ids)
+        else:
+            removed = model.objects.remove_many(request.user, recipe_ids)
+            if recipe_ids is None:
+                recipe_ids = removed
+            removed = set(removed)
+            outcomes = {
+                recipe_id: 'removed' if recipe_id in removed else 'missing'
+                for recipe_id in recipe_ids
+            }
+        return Response({'recipes': [
+            {'id': recipe_id, 'status': outcome}
+            for recipe_id, outcome in outcomes.items()
+        ]})
 
-            if favorite.exists():
-                error = {
-                    'errors': 'Нельзя повторно добавить рецепт в избранное.'
-                }
-                return Response(error, status=status.HTTP_400_BAD_REQUEST)
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        url_path='shopping_cart',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_recipes(request, Cart)
 
-            Favorite(
-                author=user,
-                recipe=recipe
-            ).save()
-            serializer = ActionsSerializer(recipe)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        url_path='favorite',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_recipes(request, Favorite)
 
-        if not favorite.exists():
-            error = {'errors': 'Этот рецепт отсутствует в вашем избранном.'}
-            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+    def get_shopping_cart(self, user):
+        """Список покупок: количества одного продукта сложены с учётом
+        единиц измерения, позиции отсортированы по названию."""
+        return aggregate_ingredients(
+            ShoppingListItem.objects.filter(
+                user=user
+            ).values_list(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                'amount'
+            ).iterator()
+        )
 
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(
+        detail=False,
+        methods=('GET',),
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def shopping_list(self, request):
+        """Список покупок в JSON."""
+        return Response(self.get_shopping_cart(request.user))
 
     @action(
         detail=False,
         methods=('GET',),
-        permission_classes=[permissions.IsAuthenticatedOrReadOnly],
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=SHOPPING_CART_RENDERERS,
     )
     def download_shopping_cart(self, request):
-        get_cart = IngredientInRecipe.objects.filter(
-            recipe__cart__author=request.user
-        ).values(
-            'ingredient__name',
-            'amount',
-            'ingredient__measurement_unit'
-        ).annotate(
-            Sum('amount')
+        """Список покупок в PDF (по умолчанию), txt, csv или json.
+
+        Формат выбирается параметром ?format= или заголовком Accept.
+        Текстовые форматы отдаются потоком.
+        """
+        user = request.user
+        renderer = request.accepted_renderer
+        if renderer.format in SHOPPING_CART_STREAMS:
+            response = StreamingHttpResponse(
+                SHOPPING_CART_STREAMS[renderer.format](
+                    self.get_shopping_cart(user)
+                ),
+                content_type=f'{renderer.media_type}; charset=utf-8'
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="shopping_cart.{renderer.format}"'
+            )
+            return response
+
+        # Итоги списка меняются только вместе с версией корзины (в том
+        # числе при правке рецепта из неё), названия — с каталогом.
+        cache_key = 'shopping_cart_pdf:{}:{}:{}'.format(
+            user.id,
+            get_version(cart_version_name(user.id)),
+            get_version('ingredients')
         )
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment;'
-        text_cart = ''
-        for value in get_cart:
-            text_cart += (
-                value['ingredient__name'] + ' ('
-                + value['ingredient__measurement_unit'] + ') — '
-                + str(value['amount__sum']) + '<br />'
+        pdf = cache.get(cache_key)
+        if pdf is None:
+            text_cart = '<br />'.join(
+                escape(
+                    f'{item["name"]} ({item["measurement_unit"]}) — '
+                    f'{format_amount(item["amount"])}'
+                )
+                for item in self.get_shopping_cart(user)
             )
+            pdf = pdf_generate(text_cart, BytesIO()).getvalue()
+            cache.set(cache_key, pdf, settings.SHOPPING_CART_CACHE_TIMEOUT)
+
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment;'
+        return response
 
-        return pdf_generate(text_cart, response)
+
+class MetricsView(APIView):
+    """Гистограммы времени и числа запросов к базе по маршрутам в
+    текстовом формате Prometheus. Только для администраторов."""
+
+    permission_classes = (IsAdminPermission,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.expose(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
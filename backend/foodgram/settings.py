@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,6 +74,50 @@ DATABASES = {
     }
 }
 
+# Версии каталогов и корзин хранятся в кэше: он должен быть общим для всех
+# процессов, включая management-команды (файловый, Redis, Memcached).
+# Атомарность incr не нужна: версия при сдвиге заменяется новым уникальным
+# значением (api.caching). Вытеснение ключа версии лишь сбрасывает кэш,
+# но для файлового кэша лимит записей поднят, чтобы версии не вытеснялись
+# постоянно ключами корзин пользователей и PDF.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.filebased.FileBasedCache'
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', default='responses'),
+    },
+}
+
+if CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=100000)),
+    }
+
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Кэш ответов API для анонимных пользователей. Правки рецептов сбрасывают
+# его сразу, а счётчики вроде favorites_count могут отставать на TTL.
+RESPONSE_CACHE = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=60))
+
+# С какого числа подписок лента пользователя ведётся на записи (FeedEntry),
+# а не собирается при чтении.
+FEED_FANOUT_THRESHOLD = int(os.getenv('FEED_FANOUT_THRESHOLD', default=1000))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -153,3 +199,25 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SITE_NAME = 'MARGDOOF.RU'
+
+# Ограничения на загружаемые изображения рецептов.
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_SIDE = 6000
+
+# Файлы из multipart-форм пишутся частями во временный файл, а не в память.
+FILE_UPLOAD_HANDLERS = ['api.uploads.LimitedTemporaryFileUploadHandler']
+
+FILE_UPLOAD_MAX_REQUEST_SIZE = RECIPE_IMAGE_MAX_SIZE + 1024 * 1024
+
+# Размеры уменьшенных копий изображений рецептов (ширина, высота).
+RECIPE_IMAGE_RENDITIONS = {
+    'small': (320, 320),
+    'medium': (640, 640),
+}
+
+# Задание, которое дольше стольких секунд числится «в работе» (воркер упал),
+# снова забирается из очереди.
+RECIPE_IMAGE_RENDITION_TIMEOUT = int(
+    os.getenv('RECIPE_IMAGE_RENDITION_TIMEOUT', default=600)
+)
@@ -1,6 +1,39 @@
 from django.contrib import admin
+from django.db.models import Prefetch, Q
 
 from .models import Ingredient, Recipes, Tag
+from .paginators import EstimatedCountPaginator
+
+
+class AuthorFilter(admin.SimpleListFilter):
+    """Фильтр по автору через поле ввода (username или email) вместо
+    выпадающего списка всех пользователей."""
+    title = 'автору'
+    parameter_name = 'author'
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (name, value)
+            for name, value in changelist.get_filters_params().items()
+            if name != self.parameter_name
+        )
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        return queryset.filter(
+            Q(author__username=value) | Q(author__email=value)
+        )
 
 
 class RecipesAdmin(admin.ModelAdmin):
@@ -10,17 +43,28 @@ class RecipesAdmin(admin.ModelAdmin):
         'author',
         'display_tag',
         'pub_date',
-        'is_favorite'
+        'is_favorite',
+        'in_carts_count'
     )
-    list_editable = ('name', 'author')
+    list_editable = ('name',)
     list_display_links = ('pk',)
+    list_select_related = ('author',)
     search_fields = ('text', 'name')
-    list_filter = ('pub_date', 'author', 'tags')
+    list_filter = ('pub_date', AuthorFilter, 'tags')
     fields = ('name', 'text', 'tags', 'author')
+    autocomplete_fields = ('author',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id', 'name'))
+        )
 
     def is_favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
     is_favorite.short_description = 'В избранном'
+    is_favorite.admin_order_field = 'favorites_count'
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -1,7 +1,26 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField)
+from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value)
+from django.db.models.functions import Coalesce
 
-from users.models import User
+from api.caching import bump_version, cart_version_name
+from users.models import Subscription, User
 
 
 class Ingredient(models.Model):
@@ -68,6 +87,144 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipesQuerySet(models.QuerySet):
+    """Выборки рецептов для API."""
+
+    def with_related(self):
+        """Подгружает автора, тэги и ингредиенты фиксированным числом
+        запросов и только с теми колонками, что нужны сериализаторам."""
+        return self.select_related('author').only(
+            'id',
+            'name',
+            'image',
+            'renditions',
+            'text',
+            'cooking_time',
+            'pub_date',
+            'favorites_count',
+            'author__id',
+            'author__email',
+            'author__username',
+            'author__first_name',
+            'author__last_name',
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).only(
+                    'id',
+                    'amount',
+                    'recipe_id',
+                    'ingredient__id',
+                    'ingredient__name',
+                    'ingredient__measurement_unit',
+                )
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Добавляет признаки «в избранном» и «в списке покупок»."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                author=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                author=user,
+                recipe=OuterRef('pk')
+            )),
+        )
+
+    def change_counter(self, field, delta):
+        """Атомарно меняет счётчик field (favorites_count или
+        in_carts_count) на delta для всех рецептов выборки.
+
+        Сигналы вызывают его для одиночных записей, массовые вставки и
+        удаления мимо ORM должны вызывать его сами.
+        """
+        if not delta:
+            return 0
+        return self.update(**{field: F(field) + delta})
+
+    def with_actual_counters(self):
+        """Добавляет посчитанные по таблицам значения счётчиков
+        actual_favorites_count и actual_in_carts_count."""
+        def count_of(model):
+            return Coalesce(Subquery(
+                model.objects.filter(
+                    recipe=OuterRef('pk')
+                ).values('recipe').annotate(
+                    total=Count('pk')
+                ).values('total')
+            ), 0)
+
+        return self.annotate(
+            actual_favorites_count=count_of(Favorite),
+            actual_in_carts_count=count_of(Cart),
+        )
+
+    def supports_full_text_search(self):
+        return connections[self.db].vendor == 'postgresql'
+
+    def update_search_vector(self):
+        """Пересчитывает сохранённый поисковый вектор рецептов."""
+        if not self.supports_full_text_search():
+            return 0
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config='russian')
+            + SearchVector('text', weight='B', config='russian')
+        ))
+
+    def search(self, text):
+        """Полнотекстовый поиск по названию и описанию.
+
+        В PostgreSQL идёт по GIN-индексу search_vector и сортирует по
+        релевантности, в остальных базах (SQLite для локальной
+        разработки) — простой поиск подстроки.
+        """
+        if not self.supports_full_text_search():
+            return self.filter(
+                Q(name__icontains=text) | Q(text__icontains=text)
+            )
+        query = SearchQuery(text, config='russian', search_type='websearch')
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date')
+
+    def latest_for_authors(self, author_ids, limit):
+        """Последние limit рецептов каждого автора одним запросом.
+
+        Отбор идёт оконной функцией ROW_NUMBER() по автору, поэтому число
+        запросов не зависит ни от количества авторов, ни от limit.
+        """
+        if not author_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        return self.raw(
+            f'SELECT id, name, image, renditions, cooking_time, author_id, '
+            f'pub_date '
+            f'FROM ('
+            f'SELECT id, name, image, renditions, cooking_time, author_id, '
+            f'pub_date, '
+            f'ROW_NUMBER() OVER ('
+            f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            f') AS row_number '
+            f'FROM {self.model._meta.db_table} '
+            f'WHERE author_id IN ({placeholders})'
+            f') AS ranked '
+            f'WHERE row_number <= %s '
+            f'ORDER BY author_id, pub_date DESC, id DESC',
+            [*author_ids, limit]
+        )
+
+
 class Recipes(models.Model):
     """Модель таблицы списка рецептов."""
     name = models.CharField(
@@ -80,6 +237,12 @@ class Recipes(models.Model):
         null=True,
         blank=True
     )
+    renditions = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     ingredients = models.ManyToManyField(
         to=Ingredient,
         verbose_name='Ингридиенты',
@@ -115,6 +278,23 @@ class Recipes(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipesQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
@@ -126,9 +306,20 @@ class Recipes(models.Model):
                 name='unique_recipes',
             ),
         )
+        indexes = (
+            GinIndex(
+                fields=('search_vector',),
+                name='recipes_search_vector',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipes_author_pub_date',
+            ),
+        )
 
     def display_tag(self):
-        return ', '.join(tags.name for tags in self.tags.all()[:3])
+        # Срез списка, а не выборки: так используются предзагруженные тэги.
+        return ', '.join(tags.name for tags in list(self.tags.all())[:3])
 
     display_tag.short_description = 'Тэг'
 
@@ -168,8 +359,121 @@ class IngredientInRecipe(models.Model):
         return f'{self.ingredient.name} {self.recipe.name}'
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """Избранное и список покупок: добавление и удаление одним запросом.
+
+    Записи меняются мимо ORM, поэтому счётчики рецептов и версия списка
+    покупок обновляются здесь же, а не сигналами.
+    """
+
+    def add(self, author, recipe):
+        """Добавляет рецепт через INSERT ... ON CONFLICT DO NOTHING.
+
+        Возвращает False, если запись уже была, в том числе при
+        одновременных запросах.
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.model._meta.db_table} '
+                    f'(author_id, recipe_id) VALUES (%s, %s) '
+                    f'ON CONFLICT DO NOTHING',
+                    [author.pk, recipe.pk]
+                )
+                added = cursor.rowcount > 0
+            if added:
+                self.changed(author.pk, [recipe.pk], 1)
+        return added
+
+    def remove(self, author, recipe_id):
+        """Удаляет рецепт одним DELETE; False, если записи не было."""
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {self.model._meta.db_table} '
+                    f'WHERE author_id = %s AND recipe_id = %s',
+                    [author.pk, recipe_id]
+                )
+                removed = cursor.rowcount > 0
+            if removed:
+                self.changed(author.pk, [recipe_id], -1)
+        return removed
+
+    def add_many(self, author, recipe_ids):
+        """Добавляет несколько рецептов одной вставкой.
+
+        Добавленными считаются только строки, которые вернул
+        INSERT ... ON CONFLICT DO NOTHING RETURNING, поэтому при
+        одновременных запросах каждый рецепт засчитывается один раз.
+        Возвращает словарь {id: 'added' | 'exists' | 'not_found'}.
+        """
+        with transaction.atomic(using=self.db):
+            found = set(Recipes.objects.filter(
+                pk__in=recipe_ids
+            ).values_list('pk', flat=True))
+            added = set()
+            if found:
+                values = ', '.join(['(%s, %s)'] * len(found))
+                with connections[self.db].cursor() as cursor:
+                    cursor.execute(
+                        f'INSERT INTO {self.model._meta.db_table} '
+                        f'(author_id, recipe_id) VALUES {values} '
+                        f'ON CONFLICT DO NOTHING RETURNING recipe_id',
+                        [value for pk in found for value in (author.pk, pk)]
+                    )
+                    added = {recipe_id for recipe_id, in cursor.fetchall()}
+            if added:
+                self.changed(author.pk, added, 1)
+        return {
+            recipe_id: (
+                'added' if recipe_id in added
+                else 'exists' if recipe_id in found
+                else 'not_found'
+            )
+            for recipe_id in recipe_ids
+        }
+
+    def remove_many(self, author, recipe_ids=None):
+        """Удаляет рецепты одним DELETE, без recipe_ids — все рецепты
+        пользователя. Возвращает список id удалённых рецептов."""
+        with transaction.atomic(using=self.db):
+            rows = self.filter(author=author)
+            if recipe_ids is not None:
+                rows = rows.filter(recipe_id__in=recipe_ids)
+            removed = list(
+                rows.select_for_update().values_list('recipe_id', flat=True)
+            )
+            if removed:
+                placeholders = ', '.join(['%s'] * len(removed))
+                with connections[self.db].cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {self.model._meta.db_table} '
+                        f'WHERE author_id = %s '
+                        f'AND recipe_id IN ({placeholders})',
+                        [author.pk, *removed]
+                    )
+                self.changed(author.pk, removed, -1)
+        return removed
+
+    def changed(self, author_id, recipe_ids, delta):
+        """То же, что делают сигналы post_save/post_delete, для записей,
+        добавленных или удалённых мимо ORM."""
+        Recipes.objects.filter(
+            pk__in=recipe_ids
+        ).change_counter(self.model.counter_field, delta)
+        if self.model is Cart:
+            bump_version(cart_version_name(author_id))
+            if delta > 0:
+                ShoppingListItem.objects.add_recipes(author_id, recipe_ids)
+            else:
+                ShoppingListItem.objects.remove_recipes(author_id, recipe_ids)
+
+
 class Favorite(models.Model):
     """Модель избранных рецептов."""
+    # Счётчик в Recipes, который поддерживается при добавлении и удалении.
+    counter_field = 'favorites_count'
+
     author = models.ForeignKey(
         User,
         verbose_name='Подписался',
@@ -182,6 +486,8 @@ class Favorite(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         constraints = (
             models.UniqueConstraint(
@@ -196,6 +502,8 @@ class Favorite(models.Model):
 
 class Cart(models.Model):
     """Модель корзины."""
+    counter_field = 'in_carts_count'
+
     author = models.ForeignKey(
         User,
         verbose_name='Подписался',
@@ -209,6 +517,8 @@ class Cart(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         constraints = (
             models.UniqueConstraint(
@@ -219,3 +529,308 @@ class Cart(models.Model):
 
     def __str__(self):
         return f'{self.author.username}: {self.recipe.name}'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """Пересчёт итогов списка покупок без повторной агрегации корзины."""
+
+    def upsert(self, select_sql, params):
+        """Прибавляет к итогам строки (user_id, ingredient_id, amount),
+        выбранные select_sql, создавая недостающие позиции."""
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'{select_sql} '
+                f'ON CONFLICT (user_id, ingredient_id) '
+                f'DO UPDATE SET amount = {table}.amount + excluded.amount',
+                params
+            )
+
+    def add_recipes(self, user_id, recipe_ids):
+        """Добавляет в список покупок ингредиенты рецептов."""
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        self.upsert(
+            f'SELECT %s, ingredient_id, SUM(amount) '
+            f'FROM {IngredientInRecipe._meta.db_table} '
+            f'WHERE recipe_id IN ({placeholders}) '
+            f'GROUP BY ingredient_id',
+            [user_id, *recipe_ids]
+        )
+
+    def remove_recipes(self, user_id, recipe_ids):
+        """Вычитает из списка покупок ингредиенты рецептов."""
+        ingredients = IngredientInRecipe.objects.filter(
+            recipe_id__in=list(recipe_ids)
+        )
+        self.filter(
+            user_id=user_id,
+            ingredient__in=ingredients.values('ingredient')
+        ).update(amount=F('amount') - Subquery(
+            ingredients.filter(
+                ingredient=OuterRef('ingredient')
+            ).values('ingredient').annotate(
+                total=Sum('amount')
+            ).values('total')
+        ))
+        self.filter(user_id=user_id, amount__lte=0).delete()
+
+    def change_recipe(self, recipe_id, deltas):
+        """Применяет изменения количеств {ingredient_id: разница} рецепта
+        к спискам всех пользователей, у которых он в корзине, и сдвигает
+        версии их корзин.
+
+        Все разницы прибавляются одной вставкой, число запросов не зависит
+        от числа ингредиентов.
+        """
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not deltas:
+            return
+        carts = Cart.objects.filter(recipe_id=recipe_id)
+        authors = list(carts.values_list('author_id', flat=True))
+        if not authors:
+            return
+        values = ', '.join(['(%s, %s)'] * len(deltas))
+        self.upsert(
+            f'SELECT cart.author_id, delta.column1, delta.column2 '
+            f'FROM {Cart._meta.db_table} AS cart, '
+            f'(VALUES {values}) AS delta '
+            f'WHERE cart.recipe_id = %s',
+            [*(value for item in deltas.items() for value in item), recipe_id]
+        )
+        if any(delta < 0 for delta in deltas.values()):
+            self.filter(
+                user__in=carts.values('author'),
+                amount__lte=0
+            ).delete()
+        for author_id in authors:
+            bump_version(cart_version_name(author_id))
+
+    def expected(self, user_ids):
+        """Итоги, посчитанные заново по корзинам пользователей:
+        {(user_id, ingredient_id): amount}."""
+        rows = IngredientInRecipe.objects.filter(
+            recipe__cart__author__in=user_ids
+        ).values(
+            'recipe__cart__author',
+            'ingredient'
+        ).annotate(
+            total=Sum('amount')
+        ).order_by()
+        return {
+            (row['recipe__cart__author'], row['ingredient']): row['total']
+            for row in rows
+        }
+
+
+class ShoppingListItem(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя.
+
+    Меняется при добавлении и удалении рецептов из корзины и при правке
+    ингредиентов рецепта, команда rebuild_shopping_lists собирает его
+    заново.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингридиент',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    amount = models.BigIntegerField(
+        'Количество',
+        default=0,
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user_id}: {self.ingredient_id} — {self.amount}'
+
+
+class FeedQuerySet(models.QuerySet):
+    """Лента на записи для тех, кто подписан на многих авторов.
+
+    Пока подписок меньше FEED_FANOUT_THRESHOLD, лента собирается при чтении
+    по подпискам, и записи здесь не ведутся.
+    """
+
+    def uses_fanout(self, user):
+        return user.following_count >= settings.FEED_FANOUT_THRESHOLD
+
+    def insert(self, select_sql, params):
+        """Добавляет в ленты строки (user_id, recipe_id, pub_date),
+        выбранные select_sql; уже бывшие записи пропускаются."""
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(user_id, recipe_id, pub_date) {select_sql} '
+                f'ON CONFLICT DO NOTHING',
+                params
+            )
+
+    def fan_out(self, recipe):
+        """Раздаёт новый рецепт в ленты подписчиков автора."""
+        self.insert(
+            f'SELECT s.user_id, r.id, r.pub_date '
+            f'FROM {Recipes._meta.db_table} r '
+            f'JOIN {Subscription._meta.db_table} s '
+            f'ON s.following_id = r.author_id '
+            f'JOIN {User._meta.db_table} u ON u.id = s.user_id '
+            f'WHERE r.id = %s AND u.following_count >= %s',
+            [recipe.pk, settings.FEED_FANOUT_THRESHOLD]
+        )
+
+    def rebuild(self, user_id):
+        """Заново собирает ленту пользователя по его подпискам."""
+        self.filter(user_id=user_id).delete()
+        self.insert(
+            f'SELECT s.user_id, r.id, r.pub_date '
+            f'FROM {Subscription._meta.db_table} s '
+            f'JOIN {Recipes._meta.db_table} r '
+            f'ON r.author_id = s.following_id '
+            f'WHERE s.user_id = %s',
+            [user_id]
+        )
+
+    def subscription_changed(self, user_id, author_id, subscribed):
+        """Поддерживает ленту после подписки или отписки.
+
+        Ленту получает тот, чьи подписки дошли до порога, и теряет тот,
+        у кого их стало меньше.
+        """
+        threshold = settings.FEED_FANOUT_THRESHOLD
+        following_count = User.objects.values_list(
+            'following_count', flat=True
+        ).get(pk=user_id)
+        if following_count < threshold:
+            if not subscribed and following_count == threshold - 1:
+                self.filter(user_id=user_id).delete()
+        elif subscribed and following_count == threshold:
+            self.rebuild(user_id)
+        elif subscribed:
+            self.insert(
+                f'SELECT %s, id, pub_date FROM {Recipes._meta.db_table} '
+                f'WHERE author_id = %s',
+                [user_id, author_id]
+            )
+        else:
+            self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipes,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    # Копия Recipes.pub_date: страница ленты читается по одному индексу.
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    objects = FeedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_entry_timeline',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class RenditionJob(models.Model):
+    """Задание на подготовку уменьшенных копий изображения рецепта."""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'В работе'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    recipe = models.ForeignKey(
+        Recipes,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='rendition_jobs',
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=15,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток',
+        default=0,
+    )
+    error = models.TextField(
+        'Ошибка',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        'Создано',
+        auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        'Изменено',
+        auto_now=True,
+    )
+
+    class Meta:
+        ordering = ('created',)
+        verbose_name = 'Задание на обработку изображения'
+        verbose_name_plural = 'Задания на обработку изображений'
+        indexes = (
+            models.Index(
+                fields=('status', 'created'),
+                name='rendition_job_queue',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.status}'
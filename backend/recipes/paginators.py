@@ -0,0 +1,34 @@
+from django.core.paginator import Paginator
+from django.db import connection, connections
+from django.utils.functional import cached_property
+
+
+# Сколько запросов count делает сверх обычного на базе по умолчанию:
+# в PostgreSQL сначала читается оценка из pg_class.
+ESTIMATE_QUERIES = int(connection.vendor == 'postgresql')
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для больших таблиц в админке.
+
+    Для нефильтрованного списка в PostgreSQL берёт оценку числа строк из
+    статистики планировщика вместо полного COUNT(*). Пока оценка меньше
+    exact_count_limit или после фильтрации, считает как обычно.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.exact_count_limit:
+                return row[0]
+        return super().count
@@ -0,0 +1,179 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api.caching import bump_version
+from recipes.models import Recipes, RenditionJob
+
+
+RENDITIONS_DIR = 'recipes/renditions'
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def render(image_path, media_root, sizes, job_id):
+    """Готовит копии изображения всех размеров и форматов.
+
+    Выполняется в отдельном процессе, поэтому работает только с путями
+    и возвращает словарь {размер: {формат: путь относительно MEDIA_ROOT}}.
+    Номер задания в имени файла не даёт рецептам с одинаковыми именами
+    изображений перезаписать копии друг друга.
+    """
+    os.makedirs(os.path.join(media_root, RENDITIONS_DIR), exist_ok=True)
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    stem = f'{stem}_{job_id}'
+    renditions = {}
+    with Image.open(image_path) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        for size, dimensions in sizes.items():
+            image = original.copy()
+            image.thumbnail(dimensions, Image.LANCZOS)
+            renditions[size] = {}
+            for extension, pillow_format, params in FORMATS:
+                name = f'{RENDITIONS_DIR}/{stem}_{size}.{extension}'
+                image.save(
+                    os.path.join(media_root, name),
+                    pillow_format,
+                    **params
+                )
+                renditions[size][extension] = name
+    return renditions
+
+
+def remove_files(renditions):
+    """Удаляет файлы копий {размер: {формат: путь}}."""
+    for formats in renditions.values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def discard(renditions):
+    """Удаляет файлы прежних копий после фиксации транзакции: при откате
+    они остаются в рецепте."""
+    if renditions:
+        transaction.on_commit(partial(remove_files, renditions))
+
+
+def enqueue(recipe):
+    """Ставит рецепт в очередь на обработку изображения.
+
+    Ещё не взятые задания рецепта снимаются: они относятся к прежнему
+    изображению.
+    """
+    RenditionJob.objects.filter(
+        recipe=recipe,
+        status=RenditionJob.PENDING
+    ).delete()
+    if recipe.image:
+        RenditionJob.objects.create(recipe=recipe)
+
+
+def claim(limit, max_attempts):
+    """Забирает из очереди до limit заданий и помечает их «в работе».
+
+    Задания, зависшие «в работе» дольше RECIPE_IMAGE_RENDITION_TIMEOUT,
+    забираются снова, а исчерпавшие попытки помечаются ошибкой.
+    """
+    now = timezone.now()
+    stale = Q(
+        status=RenditionJob.PROCESSING,
+        updated__lt=now - timedelta(
+            seconds=settings.RECIPE_IMAGE_RENDITION_TIMEOUT
+        )
+    )
+    with transaction.atomic():
+        RenditionJob.objects.filter(
+            stale, attempts__gte=max_attempts
+        ).update(
+            status=RenditionJob.FAILED,
+            error='Обработка не завершилась вовремя.',
+            updated=now
+        )
+        jobs = list(
+            RenditionJob.objects.select_for_update(
+                skip_locked=True
+            ).filter(
+                Q(status=RenditionJob.PENDING) | stale
+            ).select_related('recipe')[:limit]
+        )
+        # Попытка засчитывается сразу: задание, на котором падает воркер,
+        # не будет забираться бесконечно.
+        RenditionJob.objects.filter(
+            pk__in=[job.pk for job in jobs]
+        ).update(
+            status=RenditionJob.PROCESSING,
+            attempts=F('attempts') + 1,
+            updated=now
+        )
+    return jobs
+
+
+def apply(job, renditions):
+    """Записывает копии в рецепт и удаляет прежние. Если изображение
+    рецепта за время обработки сменилось или рецепт удалён, удаляются
+    только что готовые копии."""
+    with transaction.atomic():
+        previous = Recipes.objects.select_for_update().filter(
+            pk=job.recipe_id,
+            image=job.recipe.image.name
+        ).values_list('renditions', flat=True).first()
+        if previous is None:
+            remove_files(renditions)
+            return
+        Recipes.objects.filter(
+            pk=job.recipe_id
+        ).update(renditions=renditions)
+        discard(previous)
+
+
+def process(limit, workers, max_attempts=3):
+    """Обрабатывает очередную пачку заданий в пуле процессов.
+
+    Возвращает число обработанных заданий.
+    """
+    jobs = claim(limit, max_attempts)
+    if not jobs:
+        return 0
+    sizes = settings.RECIPE_IMAGE_RENDITIONS
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            job: pool.submit(
+                render,
+                job.recipe.image.path,
+                settings.MEDIA_ROOT,
+                sizes,
+                job.pk
+            )
+            for job in jobs
+            if job.recipe.image
+        }
+    for job in jobs:
+        job.attempts += 1  # В базе попытка уже засчитана в claim().
+        future = futures.get(job)
+        try:
+            if future is None:
+                raise ValueError('У рецепта нет изображения.')
+            renditions = future.result()
+        except Exception as error:
+            job.error = repr(error)
+            job.status = (
+                RenditionJob.FAILED if job.attempts >= max_attempts
+                else RenditionJob.PENDING
+            )
+        else:
+            job.error = ''
+            job.status = RenditionJob.DONE
+            apply(job, renditions)
+        job.save(update_fields=('attempts', 'error', 'status', 'updated'))
+    bump_version('recipes')
+    return len(jobs)
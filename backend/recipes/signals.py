@@ -0,0 +1,102 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete)
+from django.dispatch import receiver
+
+from api.caching import bump_version, cart_version_name
+from recipes import renditions
+from recipes.models import (
+    Cart,
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    IngredientInRecipe,
+    Recipes,
+    ShoppingListItem,
+    Tag)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_version('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    bump_version('tags')
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def ingredient_in_recipe_changed(**kwargs):
+    bump_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=Cart)
+def cart_changed(instance, **kwargs):
+    bump_version(cart_version_name(instance.author_id))
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+def recipe_changed(**kwargs):
+    bump_version('recipes')
+
+
+@receiver(post_delete, sender=Recipes)
+def recipe_renditions_deleted(instance, **kwargs):
+    renditions.discard(instance.renditions)
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def recipe_tags_changed(action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version('recipes')
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_saved(instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        Recipes.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Recipes)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+def recipe_counter_added(sender, instance, created, **kwargs):
+    if created:
+        Recipes.objects.filter(
+            pk=instance.recipe_id
+        ).change_counter(sender.counter_field, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+def recipe_counter_removed(sender, instance, **kwargs):
+    Recipes.objects.filter(
+        pk=instance.recipe_id
+    ).change_counter(sender.counter_field, -1)
+
+
+@receiver(post_save, sender=Cart)
+def shopping_list_added(instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.author_id,
+            [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=Cart)
+def shopping_list_removed(instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты
+    # ещё на месте.
+    ShoppingListItem.objects.remove_recipes(
+        instance.author_id,
+        [instance.recipe_id]
+    )
@@ -0,0 +1,202 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from recipes import renditions
+from recipes.models import Cart, Favorite, Recipes, RenditionJob, Tag
+from recipes.paginators import ESTIMATE_QUERIES
+from users.models import User
+
+
+class RecipesAdminQueriesTest(TestCase):
+    """Список рецептов в админке строится фиксированным числом запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тэг {i}', color=f'#00000{i}', slug=f'tag-{i}'
+            ) for i in range(4)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_recipes(self, count):
+        start = Recipes.objects.count()
+        User.objects.bulk_create(
+            User(username=f'author{number}', email=f'author{number}@ex.com')
+            for number in range(start, count)
+        )
+        for number in range(start, count):
+            recipe = Recipes.objects.create(
+                author=User.objects.get(username=f'author{number}'),
+                name=f'Рецепт {number}',
+                text='Описание рецепта для тестов.',
+                cooking_time=10,
+            )
+            recipe.tags.set(self.tags)
+            Favorite.objects.create(author=self.admin, recipe=recipe)
+            Cart.objects.create(author=recipe.author, recipe=recipe)
+
+    def test_changelist_query_count(self):
+        url = reverse('admin:recipes_recipes_changelist')
+        for count in (5, 100):
+            self.create_recipes(count)
+            with self.subTest(count=count), self.assertNumQueries(
+                6 + ESTIMATE_QUERIES
+            ):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, f'Рецепт {count - 1}')
+
+
+def uploaded_image(name, image_format):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'green').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class RenditionsTest(TestCase):
+    """Очередь уменьшенных копий изображений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def create_recipe(self, name, image):
+        return Recipes.objects.create(
+            author=self.author,
+            name=name,
+            text='Описание рецепта для тестов.',
+            cooking_time=10,
+            image=image,
+        )
+
+    def test_same_image_stem_does_not_overwrite_renditions(self):
+        recipes = [
+            self.create_recipe('Первый', uploaded_image('photo.jpg', 'JPEG')),
+            self.create_recipe('Второй', uploaded_image('photo.png', 'PNG')),
+        ]
+        for recipe in recipes:
+            renditions.enqueue(recipe)
+        self.assertEqual(renditions.process(10, 1), 2)
+        names = []
+        for recipe in recipes:
+            recipe.refresh_from_db()
+            for formats in recipe.renditions.values():
+                names.extend(formats.values())
+        self.assertEqual(len(names), len(set(names)))
+        for name in names:
+            self.assertTrue(
+                os.path.exists(os.path.join(self.media_root, name))
+            )
+
+    def test_stale_processing_jobs_are_reclaimed(self):
+        recipe = self.create_recipe(
+            'Рецепт', uploaded_image('photo.png', 'PNG')
+        )
+        stale, running, exhausted = (
+            RenditionJob.objects.create(
+                recipe=recipe,
+                status=RenditionJob.PROCESSING,
+                attempts=attempts
+            ) for attempts in (1, 1, 3)
+        )
+        long_ago = timezone.now() - timedelta(hours=1)
+        RenditionJob.objects.filter(
+            pk__in=(stale.pk, exhausted.pk)
+        ).update(updated=long_ago)
+
+        self.assertEqual(renditions.process(10, 1), 1)
+        for job in (stale, running, exhausted):
+            job.refresh_from_db()
+        self.assertEqual(stale.status, RenditionJob.DONE)
+        self.assertEqual(stale.attempts, 2)
+        self.assertEqual(running.status, RenditionJob.PROCESSING)
+        self.assertEqual(exhausted.status, RenditionJob.FAILED)
+
+    def rendition_paths(self, recipe):
+        recipe.refresh_from_db()
+        return [
+            os.path.join(self.media_root, name)
+            for formats in recipe.renditions.values()
+            for name in formats.values()
+        ]
+
+    def test_enqueue_supersedes_pending_jobs(self):
+        recipe = self.create_recipe(
+            'Рецепт', uploaded_image('photo.png', 'PNG')
+        )
+        renditions.enqueue(recipe)
+        renditions.enqueue(recipe)
+        self.assertEqual(recipe.rendition_jobs.count(), 1)
+
+    def test_replaced_renditions_are_deleted(self):
+        recipe = self.create_recipe(
+            'Рецепт', uploaded_image('photo.png', 'PNG')
+        )
+        renditions.enqueue(recipe)
+        renditions.process(10, 1)
+        old_paths = self.rendition_paths(recipe)
+        self.assertTrue(all(map(os.path.exists, old_paths)))
+
+        recipe.image = uploaded_image('other.png', 'PNG')
+        recipe.save()
+        renditions.enqueue(recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(renditions.process(10, 1), 1)
+        new_paths = self.rendition_paths(recipe)
+        self.assertTrue(all(map(os.path.exists, new_paths)))
+        self.assertFalse(any(map(os.path.exists, old_paths)))
+
+    def test_renditions_of_replaced_image_are_dropped(self):
+        recipe = self.create_recipe(
+            'Рецепт', uploaded_image('photo.png', 'PNG')
+        )
+        job = RenditionJob.objects.create(recipe=recipe)
+        rendered = renditions.render(
+            recipe.image.path,
+            self.media_root,
+            {'small': (32, 32)},
+            job.pk
+        )
+        Recipes.objects.filter(pk=recipe.pk).update(image='recipes/new.png')
+        renditions.apply(job, rendered)
+        self.assertEqual(self.rendition_paths(recipe), [])
+        self.assertFalse(any(
+            os.path.exists(os.path.join(self.media_root, name))
+            for name in rendered['small'].values()
+        ))
+
+    def test_recipe_delete_removes_renditions(self):
+        recipe = self.create_recipe(
+            'Рецепт', uploaded_image('photo.png', 'PNG')
+        )
+        renditions.enqueue(recipe)
+        renditions.process(10, 1)
+        paths = self.rendition_paths(recipe)
+        self.assertTrue(paths)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertFalse(any(map(os.path.exists, paths)))
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from recipes.paginators import EstimatedCountPaginator
+
 from .models import User
 
 
@@ -12,8 +14,11 @@ class UserAdmin(admin.ModelAdmin):
         'role',
         'date_joined'
     )
-    search_fields = ('text', 'email')
+    search_fields = ('username', 'email')
+    ordering = ('username',)
     list_filter = ('date_joined',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.4 on 2026-10-18 17:22
+
+from django.db import migrations, transaction
+from django.db.models import Count, F, Max, Min
+
+BATCH_SIZE = 1000
+
+
+def dedupe_subscriptions(apps, schema_editor):
+    """Удаляет подписки на себя и повторные подписки (остаётся самая
+    ранняя). Таблица проходится по диапазонам user_id, каждый диапазон —
+    в своей транзакции, чтобы не держать долгих блокировок."""
+    Subscription = apps.get_model('users', 'Subscription')
+    alias = schema_editor.connection.alias
+    subscriptions = Subscription.objects.using(alias)
+    last_user = subscriptions.aggregate(last=Max('user'))['last']
+    if last_user is None:
+        return
+    for start in range(0, last_user + 1, BATCH_SIZE):
+        batch = subscriptions.filter(
+            user__gte=start, user__lt=start + BATCH_SIZE
+        )
+        with transaction.atomic(using=alias):
+            batch.filter(user=F('following')).delete()
+            duplicates = batch.values('user', 'following').annotate(
+                first_id=Min('id'),
+                total=Count('id')
+            ).filter(
+                total__gt=1
+            ).order_by()
+            for row in duplicates:
+                batch.filter(
+                    user=row['user'],
+                    following=row['following'],
+                    id__gt=row['first_id']
+                ).delete()
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_subscriptions, migrations.RunPython.noop),
+    ]
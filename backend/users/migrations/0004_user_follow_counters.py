@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-18 17:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_follow_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscription = apps.get_model('users', 'Subscription')
+
+    def count_by(field):
+        return Coalesce(Subquery(
+            Subscription.objects.filter(
+                **{field: OuterRef('pk')}
+            ).values(field).annotate(total=Count('pk')).values('total')
+        ), 0)
+
+    User.objects.using(schema_editor.connection.alias).update(
+        followers_count=count_by('following'),
+        following_count=count_by('user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_subscription_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.RunPython(fill_follow_counters, migrations.RunPython.noop),
+    ]
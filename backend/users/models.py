@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Coalesce
 
 
 class User(AbstractUser):
@@ -43,6 +44,18 @@ class User(AbstractUser):
         default=USER
     )
 
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    following_count = models.PositiveIntegerField(
+        'Подписок',
+        default=0,
+        editable=False,
+    )
+
     @property
     def is_admin(self):
         return self.role == self.ADMIN or self.is_superuser
@@ -51,6 +64,41 @@ class User(AbstractUser):
         return self.email
 
 
+class SubscriptionQuerySet(models.QuerySet):
+    """Подписки и счётчики подписчиков/подписок пользователей."""
+
+    def changed(self, user_id, following_ids, delta):
+        """Обновляет счётчики после добавления (delta=1) или удаления
+        (delta=-1) подписок user_id на following_ids."""
+        following_ids = list(following_ids)
+        if not following_ids:
+            return
+        User.objects.filter(pk=user_id).update(
+            following_count=models.F('following_count')
+            + delta * len(following_ids)
+        )
+        User.objects.filter(pk__in=following_ids).update(
+            followers_count=models.F('followers_count') + delta
+        )
+
+    def with_actual_counters(self, users):
+        """Добавляет к выборке пользователей посчитанные по таблице
+        подписок actual_followers_count и actual_following_count."""
+        def count_by(field):
+            return Coalesce(models.Subquery(
+                self.filter(
+                    **{field: models.OuterRef('pk')}
+                ).values(field).annotate(
+                    total=models.Count('pk')
+                ).values('total')
+            ), 0)
+
+        return users.annotate(
+            actual_followers_count=count_by('following'),
+            actual_following_count=count_by('user'),
+        )
+
+
 class Subscription(models.Model):
     """Модель пользовательских подписок."""
     user = models.ForeignKey(
@@ -64,8 +112,22 @@ class Subscription(models.Model):
         related_name='author',
     )
 
+    objects = SubscriptionQuerySet.as_manager()
+
     class Meta:
-        models.UniqueConstraint(
-            fields=('user', 'following'),
-            name='unique_subscription_user'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'following'),
+                name='unique_subscription_user'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('following')),
+                name='prevent_self_subscription'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('following', 'user'),
+                name='subscription_following_user'
+            ),
         )
@@ -1,9 +1,10 @@
+from api.metrics import TimedSerializerMixin
 from api.serializers import RecipeSmallSerializer
 from rest_framework import serializers
 from users.models import Subscription, User
 
 
-class UserShowSerializer(serializers.ModelSerializer):
+class UserShowSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для вывода пользователя/списка пользователей."""
     email = serializers.EmailField(required=True)
     username = serializers.CharField(max_length=150, required=True)
@@ -12,6 +13,10 @@ class UserShowSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
     def get_is_subscribed(self, username):
+        # В списках и профилях значение уже посчитано аннотацией
+        # CustomUserViewSet.get_queryset().
+        if hasattr(username, 'is_subscribed'):
+            return username.is_subscribed
         user = self.context["request"].user
         return (not user.is_anonymous
                 and Subscription.objects.filter(
@@ -28,6 +33,8 @@ class UserShowSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'is_subscribed',
+            'followers_count',
+            'following_count',
         )
 
 
@@ -134,6 +141,7 @@ class SubShowSerializer(UserShowSerializer):
     last_name = serializers.ReadOnlyField(source='following.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -145,16 +153,36 @@ class SubShowSerializer(UserShowSerializer):
             'last_name',
             'is_subscribed',
             'recipes',
+            'recipes_count',
         )
 
     def get_is_subscribed(self, username):
         """Если мы запрашиваем этот метод — мы подписаны на пользователя"""
         return True
 
+    @staticmethod
+    def get_recipes_limit(request):
+        """Сколько рецептов автора выводить (параметр recipes_limit)."""
+        try:
+            return max(int(request.query_params.get('recipes_limit', 3)), 0)
+        except ValueError:
+            return 3
+
     def get_recipes(self, data):
-        """Получаем рецепты пользователя."""
-        limit = self.context.get('request').query_params.get('recipes_limit')
-        if not limit:
-            limit = 3
-        recipes = data.following.recipes.all()[:int(limit)]
+        """Получаем рецепты пользователя.
+
+        Для страницы подписок рецепты всех авторов заранее выбраны одним
+        запросом и переданы в контексте как recipes_by_author.
+        """
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(data.following_id, [])
+        else:
+            limit = self.get_recipes_limit(self.context.get('request'))
+            recipes = data.following.recipes.all()[:limit]
         return RecipeSmallSerializer(recipes, many=True).data
+
+    def get_recipes_count(self, data):
+        if hasattr(data, 'recipes_count'):
+            return data.recipes_count
+        return data.following.recipes.count()
@@ -0,0 +1,33 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from recipes.paginators import ESTIMATE_QUERIES
+from users.models import User
+
+
+class UserAdminQueriesTest(TestCase):
+    """Список пользователей в админке строится фиксированным числом
+    запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_query_count(self):
+        url = reverse('admin:users_user_changelist')
+        for count in (5, 100):
+            User.objects.bulk_create(
+                User(username=f'user{number}', email=f'user{number}@ex.com')
+                for number in range(User.objects.count() - 1, count)
+            )
+            with self.subTest(count=count), self.assertNumQueries(
+                4 + ESTIMATE_QUERIES
+            ):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'user0')
@@ -1,6 +1,8 @@
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from recipes.models import User
+from recipes.models import FeedEntry, Recipes, User
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
@@ -15,6 +17,18 @@ class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     pagination_class = PageNumberPagination
 
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if user.is_anonymous:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(
+                user=user,
+                following=OuterRef('pk')
+            )
+        ))
+
     @action(
         detail=True,
         methods=('POST', 'DELETE'),
@@ -23,20 +37,22 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         user = get_object_or_404(User, id=id)
-        follow = Subscription.objects.filter(
-            user=request.user,
-            following=user
-        )
         if request.method == 'POST':
             if user == request.user:
                 error = {
                     'errors': 'Вы пытаетесь подписаться на себя.'
                 }
                 return Response(error, status=status.HTTP_400_BAD_REQUEST)
-            obj, created = Subscription.objects.get_or_create(
-                user=request.user,
-                following=user
-            )
+            with transaction.atomic():
+                obj, created = Subscription.objects.get_or_create(
+                    user=request.user,
+                    following=user
+                )
+                if created:
+                    Subscription.objects.changed(request.user.id, [user.id], 1)
+                    FeedEntry.objects.subscription_changed(
+                        request.user.id, user.id, True
+                    )
             if not created:
                 error = {
                     'errors': 'Вы уже подписаны на этого пользователя.'
@@ -45,12 +61,21 @@ class CustomUserViewSet(UserViewSet):
             serializer = SubShowSerializer(obj, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if not follow.exists():
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user,
+                following=user
+            ).delete()
+            if deleted:
+                Subscription.objects.changed(request.user.id, [user.id], -1)
+                FeedEntry.objects.subscription_changed(
+                    request.user.id, user.id, False
+                )
+        if not deleted:
             error = {
                 'errors': 'Вы не были подписаны на этого пользователя.'
             }
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
-        follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -60,11 +85,29 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         pages = self.paginate_queryset(
-            Subscription.objects.filter(user=request.user)
+            Subscription.objects.filter(
+                user=request.user
+            ).select_related(
+                'following'
+            ).annotate(
+                recipes_count=Count('following__recipes')
+            ).order_by('-id')
         )
 
+        recipes_by_author = {}
+        for recipe in Recipes.objects.latest_for_authors(
+            [subscription.following_id for subscription in pages],
+            SubShowSerializer.get_recipes_limit(request)
+        ):
+            recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
+
         serializer = SubShowSerializer(
-            pages, many=True, context={'request': request}
+            pages,
+            many=True,
+            context={
+                'request': request,
+                'recipes_by_author': recipes_by_author
+            }
         )
 
         return self.get_paginated_response(serializer.data)